@@ -1,12 +1,120 @@
 from model import Model
-from context_extractor import ContextExtractor
+from context_extractor import get_default_registry
+from context_assembler import ContextAssembler, count_tokens, token_budget_for
 from tools import tools
 from langchain.schema import HumanMessage, AIMessage, BaseMessage
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import ToolMessage, AIMessageChunk, RemoveMessage
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from typing import List, Dict, Any, TypedDict, Annotated
-from langgraph.graph.message import add_messages
+from langgraph.config import get_config
+from langchain_core.runnables import RunnableLambda
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from typing import List, Dict, Any, TypedDict, Annotated, Generator
+from langgraph.graph.message import add_messages, REMOVE_ALL_MESSAGES
+from collections import deque
+from itertools import zip_longest
+from ttl_cache import TTLCache
+from response_cache import get_default_response_cache, normalize_query
+from conversation_memory import ConversationMemory, DEFAULT_MEMORY_TOKEN_BUDGET, local_summarizer, model_summarizer
+from chapter_summaries import model_chapter_summarizer
+from telemetry import annotate, current_request_id, get_telemetry
+from tool_runner import DEFAULT_TOOL_TIMEOUT, ToolRunner
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZER_MODES = ("always", "adaptive", "never")
+AMBIGUOUS_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "he", "she", "him", "her", "here", "there", "above", "previous", "again",
+}
+FOLLOW_UP_PREFIXES = ("and ", "what about", "how about", "why is that", "what does that", "explain more", "more on")
+
+# Optimizer rewrites shared by every agent, keyed by model, context and normalized query
+_rewrite_cache = TTLCache(maxsize=2048, ttl=3600.0)
+
+# LLM requests per second allowed for batch runs, shared by every batch against a provider
+PROVIDER_REQUESTS_PER_SECOND = {
+    "openai": 5.0,
+    "groq": 0.5,
+    "google": 0.25,
+}
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+_provider_limiters = {}
+_provider_limiters_lock = threading.Lock()
+
+# Set while a batch runs; async nodes wait on it before each model call
+_llm_rate_limiter = contextvars.ContextVar("kriar_llm_rate_limiter", default=None)
+
+
+def rate_limiter_for(model_provider: str) -> InMemoryRateLimiter:
+    """Process-wide request rate limiter for a provider"""
+    with _provider_limiters_lock:
+        limiter = _provider_limiters.get(model_provider)
+        if limiter is None:
+            limiter = _provider_limiters[model_provider] = InMemoryRateLimiter(
+                requests_per_second=PROVIDER_REQUESTS_PER_SECOND.get(model_provider, DEFAULT_REQUESTS_PER_SECOND),
+                check_every_n_seconds=0.05,
+            )
+        return limiter
+
+
+async def llm_slot():
+    """Wait for the current batch's rate limiter, if any"""
+    limiter = _llm_rate_limiter.get()
+    if limiter is not None:
+        await limiter.aacquire()
+
+
+async def run_in_thread(fn, *args):
+    """Run a blocking call in the default executor, in a copy of the caller's context so its spans stay on the trace"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, fn, *args))
+
+
+def video_id_of(extractor) -> str:
+    return extractor.video_id if extractor else ""
+
+
+def query_is_ambiguous(query: str, min_words: int = 4, pronoun_ratio: float = 0.2) -> bool:
+    """Cheap local check for queries that benefit from an optimizer rewrite"""
+    normalized = normalize_query(query)
+    words = normalized.split()
+    if len(words) < min_words:
+        return True
+    if normalized.startswith(FOLLOW_UP_PREFIXES):
+        return True
+    return sum(word in AMBIGUOUS_WORDS for word in words) / len(words) >= pronoun_ratio
+
+
+def message_text(message) -> str:
+    """Plain text of a message or message chunk, whatever shape the provider returns"""
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+        if isinstance(part, (str, dict))
+    )
+
+
+def render_history(history) -> str:
+    return "\n".join(message_text(message) for message in history)
+
+
+def llm_usage(messages, result) -> Dict[str, int]:
+    """Input/output tokens of an LLM call, from provider usage metadata or estimated"""
+    usage = getattr(result, "usage_metadata", None) or {}
+    return {
+        "tokens_in": usage.get("input_tokens") or sum(count_tokens(message_text(m)) for m in messages),
+        "tokens_out": usage.get("output_tokens") or count_tokens(message_text(result)),
+    }
 
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
@@ -16,37 +124,191 @@ class AgentState(TypedDict):
     timestamp: float
     video_url: str
     final_result: str
+    optimizer: str
+    timings: Dict[str, float]
+    context_stats: Dict[str, int]
+    history: List[BaseMessage]
+    tool_iterations: int
+    error: str
 
 class KriarLearningAgent:
-    def __init__(self, model_provider="groq", model_name="openai/gpt-oss-20b"):
+    def __init__(self, model_provider="groq", model_name="openai/gpt-oss-20b", extractors=None,
+                 optimizer_mode="adaptive", response_cache=None, retrieval_top_k=3, semantic_top_k=3, context_token_budget=None,
+                 memory_token_budget=DEFAULT_MEMORY_TOKEN_BUDGET, summary_model=None, checkpointer=None, session_id="default",
+                 max_tool_iterations=2, tool_timeout=DEFAULT_TOOL_TIMEOUT, tool_timeouts=None, chapter_summaries=True):
+        if optimizer_mode not in OPTIMIZER_MODES:
+            raise ValueError(f"Invalid optimizer mode: {optimizer_mode}")
         self.model = Model(model_provider, model_name)
+        self.optimizer_mode = optimizer_mode
+        self.retrieval_top_k = retrieval_top_k
+        self.semantic_top_k = semantic_top_k
+        self.context_token_budget = context_token_budget
         self.tools = tools
+        # Tool rounds per question before the executor must answer without tools
+        self.max_tool_iterations = max_tool_iterations
+        self.tool_runner = ToolRunner(self.tools, timeout=tool_timeout, timeouts=tool_timeouts)
         self.context_extractor = None
+        self.extractors = extractors if extractors is not None else get_default_registry()
+        self._graph = None
+        self._batch_graph = None
+        self.request_metrics = deque(maxlen=200)
+        self.response_cache = response_cache if response_cache is not None else get_default_response_cache()
+        # One conversation memory per video session; summary_model is an optional cheap Model for compression
+        self.memory_token_budget = memory_token_budget
+        self.summary_model = summary_model
+        self.summarizer = model_summarizer(summary_model) if summary_model is not None else local_summarizer
+        # Chapter summaries are built once per video in the background and shared through the transcript cache
+        self.chapter_summaries = chapter_summaries
+        self.memories = TTLCache(maxsize=32, ttl=None)
+        # With a checkpointer, each session/video pair is a LangGraph thread whose last state survives restarts
+        self.checkpointer = checkpointer
+        self.session_id = session_id
+        self.telemetry = get_telemetry()
 
     def set_video_context(self, video_url: str, timestamp: float = 0):
-        """Set the video context for the agent"""
+        """Set the video context for the agent, reusing an already loaded extractor"""
         try:
-            self.context_extractor = ContextExtractor(video_url, timestamp)
+            self.context_extractor = self.load_video(video_url)
             return True
-        except Exception as e:
+        except ValueError:
             return False
 
-    def create_graph(self):
+    def load_video(self, video_url: str = None):
+        """Extractor a question runs against: the video at video_url, else the agent's current one.
+
+        Raises ValueError when the video cannot be loaded.
+        """
+        if not video_url:
+            return self.context_extractor
+        try:
+            extractor = self.extractors.get_or_create(video_url)
+        except Exception as e:
+            raise ValueError(f"Could not load video context: {e}") from e
+        self.summarize_chapters(extractor)
+        return extractor
+
+    def summarize_chapters(self, extractor=None):
+        """Start building chapter summaries for a video (the current one by default) unless they exist or are underway"""
+        extractor = extractor or self.context_extractor
+        if self.chapter_summaries and extractor and extractor.transcript:
+            summarizer = model_chapter_summarizer(self.summary_model or self.model)
+            self.extractors.summarize_chapters(extractor, summarizer)
+
+    def invalidate_video_context(self, video_id: str = None, purge_cache: bool = False):
+        """Drop loaded extractors so the next question reloads the video"""
+        self.extractors.invalidate(video_id, purge_cache=purge_cache)
+        if self.context_extractor and (video_id is None or self.context_extractor.video_id == video_id):
+            self.context_extractor = None
+
+    def memory_for(self, video_id: str = None) -> ConversationMemory:
+        """Conversation memory for a video, defaulting to the one currently loaded"""
+        if video_id is None:
+            video_id = self.context_extractor.video_id if self.context_extractor else ""
+        memory = self.memories.get(video_id)
+        if memory is None:
+            memory = ConversationMemory(self.memory_token_budget, summarizer=self.summarizer)
+            self.memories.set(video_id, memory)
+        return memory
+
+    def remember(self, query: str, response: str, video_id: str = None):
+        """Add a finished turn to a video's conversation memory (the current one by default) and checkpoint it"""
+        if response:
+            memory = self.memory_for(video_id)
+            memory.add_turn(query, response)
+            self.checkpoint_memory(memory, video_id)
+
+    def checkpoint_memory(self, memory: ConversationMemory, video_id: str = None):
+        """Save the memory into this session's checkpointed AgentState so resume_memory can restore it"""
+        if self.checkpointer is None:
+            return
+        try:
+            # Written as the executor, whose edges end the run, so the thread is left with nothing to resume
+            self.get_graph().update_state(
+                self.thread_config(video_id), {"history": memory.messages()}, as_node="executor_node")
+        except Exception as e:
+            logger.warning("Could not checkpoint conversation memory: %s", e)
+
+    def clear_memory(self, video_id: str = None):
+        """Forget the conversation for one video, or for all of them"""
+        if video_id is None:
+            self.memories.clear()
+        else:
+            self.memories.pop(video_id)
+
+    def restore_memory(self, video_id: str, turns):
+        """Rebuild a video's conversation memory from persisted (question, answer) pairs"""
+        memory = self.memory_for(video_id)
+        memory.clear()
+        for question, answer in turns:
+            memory.add_turn(question, answer)
+        return memory
+
+    def resume_memory(self, video_id: str):
+        """Restore a video's conversation memory from the checkpoint; None when there is nothing saved"""
+        history = self.saved_state(video_id).get("history")
+        if not history:
+            return None
+        memory = self.memory_for(video_id)
+        memory.load(history)
+        return memory
+
+    def thread_config(self, video_id: str = None) -> Dict[str, Any]:
+        """Run config naming the checkpoint thread for this session and video"""
+        if video_id is None:
+            video_id = self.context_extractor.video_id if self.context_extractor else ""
+        return {"configurable": {"thread_id": f"{self.session_id}:{video_id}"}}
+
+    def run_config(self, extractor) -> Dict[str, Any]:
+        """Config for one question's graph run: its checkpoint thread and the extractor context_node reads.
+
+        Configurable objects are not checkpointed, so the extractor travels with
+        the call instead of living on the agent.
+        """
+        config = self.thread_config(video_id_of(extractor))
+        config["configurable"]["extractor"] = extractor
+        return config
+
+    def saved_state(self, video_id: str = None) -> Dict[str, Any]:
+        """Last checkpointed AgentState for this session and video, or {} without a checkpointer"""
+        if self.checkpointer is None:
+            return {}
+        return self.get_graph().get_state(self.thread_config(video_id)).values
+
+    def get_graph(self):
+        """Return the compiled workflow, compiling it on first use"""
+        if self._graph is None:
+            self._graph = self.create_graph(self.checkpointer)
+        return self._graph
+
+    def get_batch_graph(self):
+        """The workflow without checkpointing, so batch questions can run side by side"""
+        if self._batch_graph is None:
+            self._batch_graph = self.create_graph()
+        return self._batch_graph
+
+    def create_graph(self, checkpointer=None):
         """Create the LangGraph workflow"""
         graph = StateGraph(AgentState)
-        graph.add_node("context_node", self.context_node)
-        graph.add_node("prompt_optimizer_node", self.prompt_optimizer_node)
-        graph.add_node("executor_node", self.executor_node)
+        graph.add_node("context_node", self.timed_node("context_node", self.context_node))
+        graph.add_node("prompt_optimizer_node", self.timed_node(
+            "prompt_optimizer_node", self.prompt_optimizer_node, self.aprompt_optimizer_node))
+        graph.add_node("executor_node", self.timed_node("executor_node", self.executor_node, self.aexecutor_node))
 
-        # Add tool node
-        tool_node = ToolNode(self.tools)
-        graph.add_node("tool_caller_node", tool_node)
+        graph.add_node("tool_caller_node", self.timed_node(
+            "tool_caller_node", self.tool_caller_node, self.atool_caller_node))
 
         # Set entry point
         graph.set_entry_point("context_node")
 
         # Add edges
-        graph.add_edge("context_node", "prompt_optimizer_node")
+        graph.add_conditional_edges(
+            "context_node",
+            self.should_optimize,
+            {
+                "optimize": "prompt_optimizer_node",
+                "skip": "executor_node"
+            }
+        )
         graph.add_edge("prompt_optimizer_node", "executor_node")
 
         # Add conditional edges
@@ -60,83 +322,206 @@ class KriarLearningAgent:
         )
         graph.add_edge("tool_caller_node", "executor_node")
 
-        return graph.compile()
+        return graph.compile(checkpointer=checkpointer)
+
+    @staticmethod
+    def timed_node(name, node, anode=None):
+        """Wrap a node (and its async variant) in a telemetry span and accumulate its wall time into state["timings"]"""
+        telemetry = get_telemetry()
+
+        def record(state, result, started):
+            timings = dict(state.get("timings") or {})
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+            result["timings"] = timings
+            return result
+
+        def run(state):
+            started = time.perf_counter()
+            with telemetry.span(name):
+                result = node(state)
+            return record(state, result, started)
+
+        async def arun(state):
+            started = time.perf_counter()
+            with telemetry.span(name):
+                result = await anode(state)
+            return record(state, result, started)
+
+        return RunnableLambda(run, afunc=arun if anode else None, name=name)
+
+    def should_optimize(self, state: AgentState) -> str:
+        """Decide whether the query goes through prompt_optimizer_node"""
+        if self.optimizer_mode == "always":
+            return "optimize"
+        if self.optimizer_mode == "adaptive" and query_is_ambiguous(state.get("query", "")):
+            return "optimize"
+        return "skip"
+
+    def rewrite_cache_key(self, query: str, context: str, history: List[BaseMessage] = ()):
+        context_hash = hashlib.sha1(context.encode("utf-8")).hexdigest()
+        # Follow-ups are rewritten against the conversation, so sessions with different histories must not share them
+        history_hash = hashlib.sha1(render_history(history).encode("utf-8")).hexdigest()
+        return (self.model.model_provider, self.model.model_name, context_hash, history_hash, normalize_query(query))
 
     def context_node(self, state: AgentState) -> AgentState:
         """Extract relevant context from video at timestamp"""
         try:
-            if self.context_extractor and state.get("timestamp") is not None:
-                print(f"Extracting context at timestamp: {state['timestamp']}")
-                # FIXED: Use get_context_at_timestamp which returns formatted text
-                context_text = self.context_extractor.get_context_at_timestamp(state["timestamp"])
-                state["context"] = context_text
-                state["metadata"] = self.context_extractor.metadata
-                print(f"Extracted context length: {len(context_text)} characters")
+            extractor = get_config().get("configurable", {}).get("extractor", self.context_extractor)
+            if extractor and state.get("timestamp") is not None and extractor.transcript:
+                assembled = self.assemble_context(extractor, state["timestamp"], state.get("query", ""))
+                state["context"] = assembled.text
+                state["metadata"] = extractor.metadata
+                state["context_stats"] = {
+                    "tokens": assembled.tokens,
+                    "naive_tokens": assembled.naive_tokens,
+                    "tokens_saved": assembled.tokens_saved,
+                }
+                annotate(context_tokens=assembled.tokens, context_tokens_saved=assembled.tokens_saved)
+                logger.debug("Extracted context at %s: %d tokens (%d saved)",
+                             state["timestamp"], assembled.tokens, assembled.tokens_saved)
             else:
                 state["context"] = ""
-                print("No context extractor or timestamp available")
+                if extractor:
+                    state["metadata"] = extractor.metadata
+                logger.info("No context extractor or timestamp available")
             return state
         except Exception as e:
-            print(f"Context extraction error: {e}")
+            logger.warning("Context extraction error: %s", e)
             state["context"] = ""
             return state
 
-    def prompt_optimizer_node(self, state: AgentState) -> AgentState:
-        """Optimize the query into best prompt for results"""
-        try:
-            query = state.get("query", "")
-            context = state.get("context", "")
+    def assemble_context(self, extractor, timestamp: float, query: str):
+        """Timestamp window plus lexical and semantic hits from elsewhere in the lecture, under the token budget"""
+        lexical = extractor.search(query, self.retrieval_top_k) if self.retrieval_top_k else []
+        semantic = extractor.semantic_search(query, self.semantic_top_k) if self.semantic_top_k else []
+        # Alternate between the two rankings since their scores are not comparable
+        hits = [hit for pair in zip_longest(lexical, semantic) for hit in pair if hit is not None]
+        budget = self.context_token_budget or token_budget_for(self.model.model_provider, self.model.model_name)
+        # Chapter summaries up to this point answer "what was covered so far?" for a quarter of the budget
+        outline = extractor.chapter_outline(timestamp, budget // 4)
+        return ContextAssembler(budget).assemble(
+            extractor.transcript, extractor.select_segment_indices(timestamp), timestamp, hits, outline)
+
+    def optimization_prompt(self, state: AgentState) -> str:
+        """Prompt asking the model to rewrite the user's query"""
+        history = render_history(state.get("history", []))
+        return f"""
+            Optimize this user query for better LLM understanding: "{state.get('query', '')}"
 
-            optimization_prompt = f"""
-            Optimize this user query for better LLM understanding: "{query}"
+            Available context from video transcript: {state.get('context', '')} and this is the meta data of the video {state.get('metadata', {})}
 
-            Available context from video transcript: {context} and this is the meta data of the video {state.get('metadata', {})}
+            Conversation so far (resolve follow-up references against it): {history or "(none)"}
 
             Create a clear, specific prompt that will help answer the user's question using the video context if 
             video context is not given then answer the question and say no context available but here is the answer.
-            this prompt also has previous messages you can use them if you want to.
             """
-            messages = [HumanMessage(content=optimization_prompt)]
-            model = self.model.create_model()
-            optimized_response = model.invoke(messages[-5:])
 
-            state["query"] = optimized_response.content
-            state["messages"] = [HumanMessage(content=optimization_prompt), AIMessage(content=optimized_response.content)]
-            return state
+    def apply_optimized_query(self, state: AgentState, optimization_prompt: str, optimized_query: str) -> AgentState:
+        state["query"] = optimized_query
+        state["messages"] = [HumanMessage(content=optimization_prompt), AIMessage(content=optimized_query)]
+        return state
+
+    def cached_rewrite(self, state: AgentState):
+        """(optimization prompt, rewrite cache key, cached rewrite or None) for this turn"""
+        optimization_prompt = self.optimization_prompt(state)
+        cache_key = self.rewrite_cache_key(state.get("query", ""), state.get("context", ""), state.get("history", []))
+        optimized_query = _rewrite_cache.get(cache_key)
+        if optimized_query is not None:
+            state["optimizer"] = "cached"
+            annotate(cache_hit=True)
+        return optimization_prompt, cache_key, optimized_query
+
+    def store_rewrite(self, state: AgentState, cache_key, messages: List[BaseMessage], result) -> str:
+        _rewrite_cache.set(cache_key, result.content)
+        state["optimizer"] = "llm"
+        annotate(cache_hit=False, **llm_usage(messages, result))
+        return result.content
+
+    def prompt_optimizer_node(self, state: AgentState) -> AgentState:
+        """Optimize the query into best prompt for results"""
+        try:
+            optimization_prompt, cache_key, optimized_query = self.cached_rewrite(state)
+            if optimized_query is None:
+                messages = [HumanMessage(content=optimization_prompt)]
+                optimized_query = self.store_rewrite(state, cache_key, messages, self.model.invoke(messages))
+            return self.apply_optimized_query(state, optimization_prompt, optimized_query)
         except Exception as e:
             return state
 
-    def executor_node(self, state: AgentState) -> AgentState:
-        """Execute the main task with context awareness"""
+    async def aprompt_optimizer_node(self, state: AgentState) -> AgentState:
+        """Async prompt_optimizer_node"""
         try:
-            query = state.get("query", "")
-            context = state.get("context", "")
+            optimization_prompt, cache_key, optimized_query = self.cached_rewrite(state)
+            if optimized_query is None:
+                messages = [HumanMessage(content=optimization_prompt)]
+                await llm_slot()
+                optimized_query = self.store_rewrite(state, cache_key, messages, await self.model.ainvoke(messages))
+            return self.apply_optimized_query(state, optimization_prompt, optimized_query)
+        except Exception as e:
+            return state
+
+    def tools_allowed(self, state: AgentState) -> bool:
+        return state.get("tool_iterations", 0) < self.max_tool_iterations
 
-            executor_prompt = f"""
+    def executor_messages(self, state: AgentState) -> List[BaseMessage]:
+        """This turn's messages, with the executor prompt on the first pass and a final-answer nudge once tools are spent"""
+        messages = state.get("messages", [])
+        if state.get("tool_iterations", 0):
+            if not self.tools_allowed(state):
+                messages.append(HumanMessage(
+                    content="No more tool calls are available. Answer now using the video context and the tool results above."
+                ))
+            return messages
+
+        executor_prompt = f"""
             You are a YouTube Learning Assistant. Answer the user's question using the provided video context.
 
-            User Question: {query}
+            User Question: {state.get("query", "")}
 
-            Video Context: {context}
+            Video Context: {state.get("context", "")}
 
             Provide a helpful, accurate answer based on the video content. If you need additional information, 
             you can use the available tools (wikipedia_query, context_search, timestamp_analyzer).
             """
 
-            messages = state.get("messages", [])
-            messages.append(HumanMessage(content=executor_prompt))
-
-            # Bind tools to model
-            model_with_tools = self.model.bind_tools(self.tools)
-            result = model_with_tools.invoke(messages[-5:])
-
-            messages.append(result)
-            state["messages"] = messages
-            state["final_result"] = result.content
+        messages.append(HumanMessage(content=executor_prompt))
+        return messages
+
+    def executor_inputs(self, state: AgentState):
+        """(this turn's messages, model to call, model inputs) for an executor pass"""
+        messages = self.executor_messages(state)
+        # Bind tools to model while the tool budget lasts; afterwards the answer is forced
+        model = self.model.bind_tools(self.tools) if self.tools_allowed(state) else self.model
+        # Every message of this turn is kept so each tool result stays paired with its call
+        return messages, model, state.get("history", []) + messages
+
+    def apply_executor_result(self, state: AgentState, messages: List[BaseMessage], inputs: List[BaseMessage],
+                              result) -> AgentState:
+        annotate(tool_calls=len(getattr(result, "tool_calls", None) or []), **llm_usage(inputs, result))
+        messages.append(result)
+        state["messages"] = messages
+        state["final_result"] = result.content
+        return state
 
+    def executor_node(self, state: AgentState) -> AgentState:
+        """Execute the main task with context awareness"""
+        try:
+            messages, model, inputs = self.executor_inputs(state)
+            return self.apply_executor_result(state, messages, inputs, model.invoke(inputs))
+        except Exception as e:
+            state["final_result"] = f"Error processing query: {str(e)}"
+            state["error"] = str(e)
             return state
+
+    async def aexecutor_node(self, state: AgentState) -> AgentState:
+        """Async executor_node"""
+        try:
+            messages, model, inputs = self.executor_inputs(state)
+            await llm_slot()
+            return self.apply_executor_result(state, messages, inputs, await model.ainvoke(inputs))
         except Exception as e:
             state["final_result"] = f"Error processing query: {str(e)}"
+            state["error"] = str(e)
             return state
 
     def should_use_tool(self, state: AgentState) -> str:
@@ -148,43 +533,318 @@ class KriarLearningAgent:
 
             last_message = messages[-1]
 
-            # Check if the last message is an AI message with tool calls
-            if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+            # Check if the last message is an AI message with tool calls, within the tool budget
+            if hasattr(last_message, 'tool_calls') and last_message.tool_calls and self.tools_allowed(state):
                 return "use_tool"
 
             return "finish"
         except Exception as e:
             return "finish"
 
+    def tool_caller_node(self, state: AgentState) -> AgentState:
+        """Run the requested tool calls concurrently and count the round against the tool budget"""
+        return {**self.tool_runner.invoke(state), "tool_iterations": state.get("tool_iterations", 0) + 1}
+
+    async def atool_caller_node(self, state: AgentState) -> AgentState:
+        """Async tool_caller_node"""
+        return {**await self.tool_runner.ainvoke(state), "tool_iterations": state.get("tool_iterations", 0) + 1}
+
+    def build_initial_state(self, query: str, extractor, timestamp: float = 0, video_url: str = None) -> AgentState:
+        """The graph's starting state for a question about the video extractor holds"""
+        return AgentState(
+            # A checkpointed thread still holds the previous turn's messages; start each turn clean
+            messages=[RemoveMessage(id=REMOVE_ALL_MESSAGES)] if self.checkpointer is not None else [],
+            query=query,
+            metadata={},
+            context="",
+            timestamp=timestamp,
+            video_url=video_url or "",
+            final_result="",
+            optimizer="skipped",
+            timings={},
+            context_stats={},
+            history=self.memory_for(video_id_of(extractor)).messages(),
+            tool_iterations=0,
+            error=""
+        )
+
+    def response_cache_key(self, extractor, timestamp: float):
+        """(scope, segments) the response cache is keyed on for the extractor's video, or None"""
+        if not extractor:
+            return None
+        scope = (self.model.model_provider, self.model.model_name, self.optimizer_mode, extractor.video_id)
+        return scope, tuple(extractor.select_segment_indices(timestamp))
+
+    def cached_response(self, extractor, query: str, timestamp: float):
+        """Return (cache_key, cached answer or None) for this question"""
+        cache_key = self.response_cache_key(extractor, timestamp)
+        # Follow-ups depend on the conversation, so another session's answer would not fit
+        if cache_key is None or (len(self.memory_for(video_id_of(extractor))) and query_is_ambiguous(query)):
+            return None, None
+        with self.telemetry.span("response_cache") as span:
+            cached = self.response_cache.get(*cache_key, query)
+            span["cache_hit"] = cached is not None
+        return cache_key, cached
+
+    def store_response(self, cache_key, query: str, response: str):
+        if cache_key is not None and response:
+            self.response_cache.set(*cache_key, query, response)
+
+    def record_metrics(self, query: str, started: float, response_cache=None, final_state=None, ttft=None, **extra):
+        """Append one request's timings and cache outcomes to request_metrics"""
+        final_state = final_state or {}
+        self.request_metrics.append({
+            "query": query,
+            "request_id": current_request_id(),
+            "ttft": ttft,
+            "total": time.perf_counter() - started,
+            "optimizer": final_state.get("optimizer", "skipped"),
+            "timings": final_state.get("timings", {}),
+            "context_stats": final_state.get("context_stats", {}),
+            "response_cache": response_cache,
+            **extra,
+        })
+
+    def begin_task(self, extractor, query: str, timestamp: float, started: float, streamed: bool = False):
+        """(response cache key, cached answer or None); a cached answer is remembered and recorded here"""
+        cache_key, cached = self.cached_response(extractor, query, timestamp)
+        if cached is not None:
+            # A streamed cache hit is shown whole, straight away
+            self.record_metrics(query, started, "hit", ttft=time.perf_counter() - started if streamed else None)
+            self.remember(query, cached, video_id_of(extractor))
+        return cache_key, cached
+
+    def finish_task(self, extractor, query: str, started: float, cache_key, final_state, remember=True,
+                    **extra) -> str:
+        """Cache, remember and record the graph's answer; a failed run is only recorded"""
+        result = final_state.get("final_result", "No result generated")
+        if not final_state.get("error"):
+            self.store_response(cache_key, query, result)
+            if remember:
+                self.remember(query, result, video_id_of(extractor))
+        self.record_metrics(query, started, "miss" if cache_key else None, final_state, **extra)
+        return result
+
     def execute_task(self, query: str, video_url: str = None, timestamp: float = 0) -> str:
         """Execute the main learning task"""
+        with self.telemetry.request(query=query, video_url=video_url or "", timestamp=timestamp):
+            return self._execute_task(query, video_url, timestamp)
+
+    def _execute_task(self, query: str, video_url: str = None, timestamp: float = 0) -> str:
         try:
-            # Set video context if provided
-            if video_url:
-                success = self.set_video_context(video_url, timestamp)
-                if not success:
-                    return "Error: Could not load video context"
-
-            # Create initial state
-            initial_state = AgentState(
-                messages=[],
-                query=query,
-                metadata={},
-                context="",
-                timestamp=timestamp,
-                video_url=video_url or "",
-                final_result=""
-            )
+            try:
+                extractor = self.context_extractor = self.load_video(video_url)
+            except ValueError:
+                return "Error: Could not load video context"
+
+            initial_state = self.build_initial_state(query, extractor, timestamp, video_url)
+            started = time.perf_counter()
+            cache_key, cached = self.begin_task(extractor, query, timestamp, started)
+            if cached is not None:
+                return cached
+            # Run the compiled graph, reused across questions
+            final_state = self.get_graph().invoke(initial_state, self.run_config(extractor))
+            return self.finish_task(extractor, query, started, cache_key, final_state)
+        except Exception as e:
+            return f"Error: {str(e)}"
 
-            # Create and run graph
-            graph = self.create_graph()
-            final_state = graph.invoke(initial_state)
+    async def execute_task_async(self, query: str, video_url: str = None, timestamp: float = 0) -> str:
+        """Async execute_task: blocking loads and checkpoint writes run in a thread, LLM calls are awaited.
 
-            return final_state.get("final_result", "No result generated")
+        Each call carries its own extractor and leaves the agent's current video
+        alone, so concurrent calls on one agent may ask about different videos.
+        """
+        with self.telemetry.request(query=query, video_url=video_url or "", timestamp=timestamp):
+            return await self._execute_task_async(query, video_url, timestamp)
 
+    async def _execute_task_async(self, query: str, video_url: str = None, timestamp: float = 0) -> str:
+        try:
+            try:
+                extractor = await run_in_thread(self.load_video, video_url)
+            except ValueError:
+                return "Error: Could not load video context"
+
+            initial_state = self.build_initial_state(query, extractor, timestamp, video_url)
+            started = time.perf_counter()
+            # Remembering a turn writes a checkpoint, which is blocking sqlite work
+            cache_key, cached = await run_in_thread(self.begin_task, extractor, query, timestamp, started)
+            if cached is not None:
+                return cached
+            final_state = await self.get_graph().ainvoke(initial_state, self.run_config(extractor))
+            return await run_in_thread(self.finish_task, extractor, query, started, cache_key, final_state)
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def stream_task(self, query: str, video_url: str = None, timestamp: float = 0) -> Generator[str, None, str]:
+        """Execute the learning task, yielding answer tokens as they are generated and returning the final answer.
+
+        Text from an executor pass that turns into a tool call stops being yielded
+        once the call shows up, and is not part of the returned answer.
+        """
+        with self.telemetry.request(query=query, video_url=video_url or "", timestamp=timestamp, streamed=True):
+            return (yield from self._stream_task(query, video_url, timestamp))
+
+    def _stream_task(self, query: str, video_url: str = None, timestamp: float = 0) -> Generator[str, None, str]:
+        try:
+            try:
+                extractor = self.context_extractor = self.load_video(video_url)
+            except ValueError:
+                yield "Error: Could not load video context"
+                return "Error: Could not load video context"
+
+            initial_state = self.build_initial_state(query, extractor, timestamp, video_url)
+            started = time.perf_counter()
+            cache_key, cached = self.begin_task(extractor, query, timestamp, started, streamed=True)
+            if cached is not None:
+                yield cached
+                return cached
+
+            final_state = {}
+            first_token_at = None
+            executor_pass = None
+            # Whether the current pass has streamed text and is still on course to be the answer
+            answer_streamed = tool_pass = False
+            for mode, payload in self.get_graph().stream(
+                    initial_state, self.run_config(extractor), stream_mode=["messages", "values"]):
+                if mode == "values":
+                    final_state = payload
+                    continue
+                chunk, metadata = payload
+                # Only model output chunks; state updates such as the executor prompt are echoed here too
+                if metadata.get("langgraph_node") != "executor_node" or not isinstance(chunk, AIMessageChunk):
+                    continue
+                if metadata.get("langgraph_step") != executor_pass:
+                    executor_pass = metadata.get("langgraph_step")
+                    answer_streamed = tool_pass = False
+                if chunk.tool_call_chunks:
+                    answer_streamed, tool_pass = False, True
+                text = message_text(chunk)
+                if text and not tool_pass:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    answer_streamed = True
+                    yield text
+
+            result = final_state.get("final_result", "No result generated")
+            # The answer was not streamed (e.g. the executor failed): show the final result
+            if not answer_streamed:
+                yield result
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            return self.finish_task(extractor, query, started, cache_key, final_state, ttft=first_token_at - started)
+        except Exception as e:
+            yield f"Error: {str(e)}"
+            return f"Error: {str(e)}"
+
+    def execute_batch(self, queries: List[str], video_url: str = None, timestamps=None, max_concurrency: int = 4,
+                      requests_per_second: float = None) -> List[Dict[str, Any]]:
+        """Blocking execute_batch_async, for callers without an event loop"""
+        return asyncio.run(self.execute_batch_async(queries, video_url, timestamps, max_concurrency, requests_per_second))
+
+    async def execute_batch_async(self, queries: List[str], video_url: str = None, timestamps=None,
+                                  max_concurrency: int = 4, requests_per_second: float = None) -> List[Dict[str, Any]]:
+        """Answer many independent questions about one video, e.g. a quiz or an FAQ.
+
+        The video is loaded once. Questions with the same normalized text and the
+        same transcript window are answered once. Up to ``max_concurrency``
+        questions run at a time, and their model calls share the provider's rate
+        limit (``PROVIDER_REQUESTS_PER_SECOND``) unless ``requests_per_second`` is
+        given. Batch questions do not use or update the conversation memory.
+
+        Returns one {"query", "timestamp", "answer", "error"} dict per question, in order.
+        """
+        if timestamps is None or isinstance(timestamps, (int, float)):
+            timestamps = [timestamps or 0] * len(queries)
+        if len(timestamps) != len(queries):
+            raise ValueError(f"Got {len(timestamps)} timestamps for {len(queries)} queries")
+
+        try:
+            extractor = await run_in_thread(self.load_video, video_url)
+        except ValueError:
+            return [{"query": q, "timestamp": t, "answer": None, "error": "Could not load video context"}
+                    for q, t in zip(queries, timestamps)]
+
+        # Questions asked twice about the same stretch of the video share one answer
+        keys = [(normalize_query(q), self.response_cache_key(extractor, t)) for q, t in zip(queries, timestamps)]
+        first = {}
+        for i, key in enumerate(keys):
+            first.setdefault(key, i)
+
+        if requests_per_second is not None:
+            limiter = InMemoryRateLimiter(requests_per_second=requests_per_second, check_every_n_seconds=0.05)
+        else:
+            limiter = rate_limiter_for(self.model.model_provider)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(i):
+            async with semaphore:
+                _llm_rate_limiter.set(limiter)
+                with self.telemetry.request(query=queries[i], video_url=video_url or "", timestamp=timestamps[i], batch=True):
+                    return await self._batch_item(extractor, queries[i], timestamps[i])
+
+        unique = sorted(set(first.values()))
+        outcomes = dict(zip(unique, await asyncio.gather(*(run(i) for i in unique), return_exceptions=True)))
+        results = []
+        for query, timestamp, key in zip(queries, timestamps, keys):
+            outcome = outcomes[first[key]]
+            if isinstance(outcome, Exception):
+                results.append({"query": query, "timestamp": timestamp, "answer": None, "error": str(outcome)})
+            else:
+                results.append({"query": query, "timestamp": timestamp, "answer": outcome, "error": None})
+        return results
+
+    async def _batch_item(self, extractor, query: str, timestamp: float) -> str:
+        started = time.perf_counter()
+        cache_key = self.response_cache_key(extractor, timestamp)
+        cached = self.response_cache.get(*cache_key, query) if cache_key is not None else None
+        if cached is not None:
+            self.record_metrics(query, started, "hit", batch=True)
+            return cached
+
+        initial_state = self.build_initial_state(query, extractor, timestamp)
+        initial_state["messages"] = []
+        initial_state["history"] = []
+        final_state = await self.get_batch_graph().ainvoke(initial_state, {"configurable": {"extractor": extractor}})
+        result = self.finish_task(extractor, query, started, cache_key, final_state, remember=False, batch=True)
+        if final_state.get("error"):
+            raise RuntimeError(result)
+        return result
+
+    def context_token_stats(self) -> Dict[str, int]:
+        """Context tokens sent vs. what the unbudgeted window plus retrieval hits would have cost"""
+        totals = {"requests": 0, "tokens": 0, "naive_tokens": 0, "tokens_saved": 0}
+        for record in self.request_metrics:
+            stats = record.get("context_stats") or {}
+            if not stats:
+                continue
+            totals["requests"] += 1
+            for key in ("tokens", "naive_tokens", "tokens_saved"):
+                totals[key] += stats.get(key, 0)
+        return totals
+
+    def response_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate of the shared response cache"""
+        return self.response_cache.stats()
+
+    def optimizer_stats(self) -> Dict[str, Any]:
+        """How often the optimizer LLM call ran, was served from cache or was skipped, and the time saved"""
+        counts = {"llm": 0, "cached": 0, "skipped": 0}
+        llm_seconds = []
+        for record in self.request_metrics:
+            if record.get("response_cache") == "hit":
+                continue
+            status = record.get("optimizer", "skipped")
+            counts[status] = counts.get(status, 0) + 1
+            if status == "llm":
+                llm_seconds.append(record.get("timings", {}).get("prompt_optimizer_node", 0.0))
+        mean_llm = sum(llm_seconds) / len(llm_seconds) if llm_seconds else 0.0
+        return {
+            **counts,
+            "mean_optimizer_seconds": mean_llm,
+            "estimated_seconds_saved": mean_llm * (counts["cached"] + counts["skipped"]),
+            "rewrite_cache": _rewrite_cache.stats(),
+        }
+
     def get_context_at_timestamp(self, timestamp: float) -> Dict[str, Any]:
         """Get video context at specific timestamp"""
         if self.context_extractor:
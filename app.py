@@ -2,16 +2,46 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from typing import List, Dict, Any
+import html
 import json
 import time
 import re
 from urllib.parse import urlparse, parse_qs
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
+from functools import cached_property
 from model import Model
-from context_extractor import ContextExtractor
-from agent import KriarLearningAgent
+from context_extractor import get_default_registry
+from agent import KriarLearningAgent, OPTIMIZER_MODES
 from tools import tools
 from streamlit_player import st_player
+from session_store import get_default_session_store
+from telemetry import get_telemetry
+import os
+import secrets
+
+# Chat messages per page of rendered history
+CHAT_PAGE_SIZE = 20
+
+# Milliseconds between player onProgress events
+DEFAULT_PROGRESS_INTERVAL_MS = int(os.getenv("KRIAR_PROGRESS_INTERVAL_MS", "1000"))
+
+# Process-wide metric and trace downloads cover every user's questions, so only operators get them
+TELEMETRY_EXPORTS = os.getenv("KRIAR_TELEMETRY_EXPORTS", "").lower() in ("1", "true", "yes")
+
+# The session ID in the URL is a bearer token: whoever has the link can resume the session,
+# so only long random IDs are accepted and hand-picked ones like ?session=demo get a fresh ID
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{32,}")
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+def record_rerun(scope):
+    """Count script runs per scope ('app' or 'player') for the reruns-per-minute readout"""
+    stats = st.session_state.setdefault('rerun_stats', {'since': time.time(), 'app': 0, 'player': 0})
+    stats[scope] += 1
+
 st.set_page_config(
     page_title="KRIAR -Learning Assistant",
     page_icon="📚",
@@ -164,6 +194,37 @@ class ChatMessage:
     timestamp: datetime
     type: str = "text"
     video_timestamp: float = 0.0
+    video_id: str = ""
+
+    # Messages never change once appended, so their HTML is built once and reused on every rerun
+    @cached_property
+    def chat_html(self) -> str:
+        # Unindented and without blank lines, so joined messages stay one HTML block rather than turning into code blocks
+        css_class = "user-message" if self.role == "user" else "assistant-message"
+        icon = "🧑" if self.role == "user" else "🤖"
+        return (
+            f'<div class="chat-message {css_class}">'
+            f'<strong>{icon} {self.role.title()}:</strong><br>'
+            f'{html_text(self.content)}<br>'
+            '</div>\n'
+        )
+
+    @cached_property
+    def sidebar_html(self) -> str:
+        position = f'<div class="timestamp-info">📍 @{self.video_timestamp}s</div>' if self.video_timestamp > 0 else ''
+        return (
+            '<div class="sidebar-section">'
+            f"<strong>{'🧑 You' if self.role == 'user' else '🤖 Assistant'}:</strong><br>"
+            f'<span style="font-size: 0.9rem;">{html_text(self.content[:80])}...</span><br>'
+            f'<span class="timestamp">{self.timestamp.strftime("%H:%M")}</span>'
+            f'{position}'
+            '</div>\n'
+        )
+
+
+def html_text(text: str) -> str:
+    """Message text escaped for an HTML block, line breaks kept as <br>"""
+    return html.escape(text).replace("\n", "<br>")
 
 @dataclass
 class VideoSession:
@@ -173,6 +234,20 @@ class VideoSession:
     start_time: datetime
     messages: List[ChatMessage]
 
+
+def chat_message_from_record(record: Dict[str, Any]) -> ChatMessage:
+    return ChatMessage(**{**record, 'timestamp': datetime.fromisoformat(record['timestamp'])})
+
+
+def conversation_turns(chat_history: List[ChatMessage], video_id: str):
+    """(question, answer) pairs asked about one video, for rebuilding the agent's memory"""
+    turns = []
+    for question, answer in zip(chat_history, chat_history[1:]):
+        if (question.role, answer.role) == ("user", "assistant") and question.video_id == video_id == answer.video_id:
+            turns.append((question.content, answer.content))
+    return turns
+
+
 class KriarLearningAssistant:
     def __init__(self):
         self.initialize_session_state()
@@ -180,9 +255,21 @@ class KriarLearningAssistant:
 
     def initialize_session_state(self):
         """Initialize all session state variables"""
+        if 'session_id' not in st.session_state:
+            # Kept in the URL so a browser refresh or a server restart resumes the same session
+            session_id = st.query_params.get("session")
+            if not session_id or not SESSION_ID_PATTERN.fullmatch(session_id):
+                session_id = new_session_id()
+                st.query_params["session"] = session_id
+            st.session_state.session_id = session_id
+            self.restore_session()
+
         if 'chat_history' not in st.session_state:
             st.session_state.chat_history = []
 
+        if 'chat_pages' not in st.session_state:
+            st.session_state.chat_pages = 1
+
         if 'code_history' not in st.session_state:
             st.session_state.code_history = []
 
@@ -204,29 +291,85 @@ class KriarLearningAssistant:
             st.session_state.event = None
         if 'video_url' not in st.session_state:
             st.session_state.video_url = None
+        if 'video_future' not in st.session_state:
+            st.session_state.video_future = None
         if 'user_preferences' not in st.session_state:
             st.session_state.user_preferences = {
                 'auto_timestamp': True,
                 'response_length': 'medium',
                 'model_provider': 'groq',
-                'model_name': 'openai/gpt-oss-20b'
+                'model_name': 'openai/gpt-oss-20b',
+                'optimizer_mode': 'adaptive',
+                'progress_interval': DEFAULT_PROGRESS_INTERVAL_MS,
+                'debug_panel': False
             }
 
+    def restore_session(self):
+        """Reload chat, code and video history for this session from the session store"""
+        try:
+            store = get_default_session_store()
+            session_id = st.session_state.session_id
+            st.session_state.chat_history = [chat_message_from_record(r) for r in store.records(session_id, "chat")]
+            st.session_state.code_history = [
+                {**r, 'timestamp': datetime.fromisoformat(r['timestamp'])} for r in store.records(session_id, "code")
+            ]
+            videos = store.records(session_id, "video")
+        except Exception as e:
+            st.warning(f"Could not restore the previous session: {e}")
+            return
+        st.session_state.video_sessions = [
+            VideoSession(r['video_id'], r['title'], r['url'], datetime.fromisoformat(r['start_time']), [])
+            for r in videos
+        ]
+        if videos:
+            last = st.session_state.video_sessions[-1]
+            # Transcript, metadata and indexes come back from the on-disk caches, not from YouTube
+            st.session_state.video_future = get_default_registry().prefetch(last.url)
+            st.session_state.video_url = last.url
+            st.session_state.current_video = {
+                'id': last.video_id,
+                'url': last.url,
+                'loaded_at': last.start_time,
+                'metadata': None
+            }
+            st.session_state.video_loaded = True
+
+    def persist(self, kind: str, record: Dict[str, Any]):
+        """Append a record to this session in the session store"""
+        try:
+            get_default_session_store().append(st.session_state.session_id, kind, record)
+        except Exception as e:
+            st.warning(f"Could not save to session history: {e}")
+
+    def add_chat_message(self, msg: ChatMessage):
+        st.session_state.chat_history.append(msg)
+        self.persist("chat", asdict(msg))
+
     def initialize_agent(self):
         """Initialize the learning agent"""
         try:
             if st.session_state.agent is None:
                 preferences = st.session_state.user_preferences
+                store = get_default_session_store()
                 st.session_state.agent = KriarLearningAgent(
                     model_provider=preferences['model_provider'],
-                    model_name=preferences['model_name']
+                    model_name=preferences['model_name'],
+                    optimizer_mode=preferences.get('optimizer_mode', 'adaptive'),
+                    checkpointer=store.checkpointer(),
+                    session_id=st.session_state.session_id
                 )
+                if st.session_state.current_video:
+                    video_id = st.session_state.current_video['id']
+                    # Resume the checkpointed memory; sessions saved without one are rebuilt from the chat records
+                    if st.session_state.agent.resume_memory(video_id) is None:
+                        st.session_state.agent.restore_memory(
+                            video_id, conversation_turns(st.session_state.chat_history, video_id))
         except Exception as e:
             st.error(f"Error initializing AI agent: {e}")
     def initialize_contextextractor(self,url,target_timestamp):
         try:
             if st.session_state.context_extractor is None:
-                st.session_state.context_extractor = ContextExtractor(url,target_timestamp=target_timestamp)
+                st.session_state.context_extractor = get_default_registry().get_or_create(url,target_timestamp=target_timestamp)
         except Exception as e:
             st.error(f"Error initializing context extractor: {e}")
     def get_timestamp(self):
@@ -280,16 +423,10 @@ class KriarLearningAssistant:
             
 
             if st.session_state.chat_history:
-                for i, msg in enumerate(st.session_state.chat_history[-3:]):
-                    with st.container():
-                        st.markdown(f"""
-                        <div class="sidebar-section">
-                            <strong>{'🧑 You' if msg.role == 'user' else '🤖 Assistant'}:</strong><br>
-                            <span style="font-size: 0.9rem;">{msg.content[:80]}...</span><br>
-                            <span class="timestamp">{msg.timestamp.strftime('%H:%M')}</span>
-                            {f'<div class="timestamp-info">📍 @{msg.video_timestamp}s</div>' if msg.video_timestamp > 0 else ''}
-                        </div>
-                        """, unsafe_allow_html=True)
+                st.markdown(
+                    "".join(msg.sidebar_html for msg in st.session_state.chat_history[-3:]),
+                    unsafe_allow_html=True
+                )
             else:
                 st.info("No conversations yet. Load a video and start asking questions!")
 
@@ -312,13 +449,126 @@ class KriarLearningAssistant:
                  ['openai', 'groq', 'google'],
                  index=['openai', 'groq', 'google'].index(st.session_state.user_preferences['model_provider'])
             )
+            optimizer_mode = st.session_state.user_preferences.get('optimizer_mode', 'adaptive')
+            st.session_state.user_preferences['optimizer_mode'] = st.selectbox(
+                 "Query Optimizer",
+                 list(OPTIMIZER_MODES),
+                 index=list(OPTIMIZER_MODES).index(optimizer_mode),
+                 help="adaptive rewrites only short or ambiguous questions; never skips the extra LLM call"
+            )
+            if st.session_state.agent:
+                st.session_state.agent.optimizer_mode = st.session_state.user_preferences['optimizer_mode']
+            progress_interval = st.session_state.user_preferences.get('progress_interval', DEFAULT_PROGRESS_INTERVAL_MS)
+            intervals = sorted({1000, 2000, 5000, 10000, progress_interval})
+            st.session_state.user_preferences['progress_interval'] = st.selectbox(
+                 "Timestamp Update Interval",
+                 intervals,
+                 index=intervals.index(progress_interval),
+                 format_func=lambda ms: f"{ms / 1000:g} s",
+                 help="How often the player reports its position; each report reruns only the player"
+            )
+            with st.expander("📈 Reruns per minute"):
+                stats = st.session_state.rerun_stats
+                minutes = max((time.time() - stats['since']) / 60, 1 / 60)
+                st.caption(f"Full app: {stats['app'] / minutes:.1f} / min")
+                st.caption(f"Player only: {stats['player'] / minutes:.1f} / min")
+            st.session_state.user_preferences['debug_panel'] = st.checkbox(
+                "🐞 Debug panel",
+                value=st.session_state.user_preferences.get('debug_panel', False),
+                help="Show per-node latency, tokens and cache hits for the last question"
+            )
+            if st.session_state.user_preferences['debug_panel']:
+                self.render_debug_panel()
             st.markdown("### Settings")
             if st.button("🔄 Reset Settings"):
+                # Only preferences are reset; history and the loaded video stay
+                del st.session_state['user_preferences']
+                st.session_state.agent = None
+                st.rerun()
+            if st.button("🆕 New Session"):
+                st.query_params["session"] = new_session_id()
                 for key in list(st.session_state.keys()):
                     del st.session_state[key]
                 st.rerun()
                           
 
+    def render_debug_panel(self):
+        """Spans of this session's most recent traced question, plus metric and trace downloads for operators"""
+        telemetry = get_telemetry()
+        agent = st.session_state.agent
+        request_ids = {metrics.get('request_id') for metrics in agent.request_metrics} if agent else set()
+        traces = telemetry.recent_traces(request_ids)
+        with st.expander("🐞 Last request trace", expanded=True):
+            if not traces:
+                st.caption("No questions traced yet")
+            else:
+                trace = traces[-1].to_dict()
+                st.caption(f"Request {trace['request_id']}: {trace['seconds']:.2f} s")
+                st.caption(
+                    f"Tokens in/out: {trace['tokens_in']} / {trace['tokens_out']} · "
+                    f"Cache hits: {trace['cache_hits']}/{trace['cache_hits'] + trace['cache_misses']} · "
+                    f"Tool loops: {trace['tool_loops']}"
+                )
+                st.dataframe(
+                    pd.DataFrame(
+                        [{'span': name, 'ms': round(seconds * 1000, 1)} for name, seconds in trace['span_seconds'].items()]
+                    ),
+                    hide_index=True,
+                    use_container_width=True
+                )
+            if TELEMETRY_EXPORTS:
+                st.download_button(
+                    "Prometheus metrics", telemetry.prometheus_text(), file_name="kriar_metrics.prom", mime="text/plain"
+                )
+                st.download_button(
+                    "Recent traces (JSONL)", telemetry.recent_jsonl(), file_name="kriar_traces.jsonl",
+                    mime="application/x-ndjson"
+                )
+
+    def sync_video_context(self):
+        """Pick up the background-loaded extractor for the current video once it is ready"""
+        future = st.session_state.get('video_future')
+        if st.session_state.context_extractor is not None or future is None or not future.done():
+            return
+        st.session_state.video_future = None
+        try:
+            context_extractor = future.result()
+        except Exception as e:
+            st.error(f"❌ Error loading video: {str(e)}")
+            return
+        # Shared with the agent so questions reuse the loaded transcript
+        st.session_state.context_extractor = context_extractor
+        if st.session_state.agent:
+            st.session_state.agent.context_extractor = context_extractor
+            st.session_state.agent.summarize_chapters()
+        if st.session_state.current_video:
+            st.session_state.current_video['metadata'] = context_extractor.metadata
+
+    @st.fragment(run_every=1.0)
+    def render_loading_status(self):
+        """Poll the background load and rerun the app once the transcript is ready"""
+        future = st.session_state.get('video_future')
+        if future is not None and future.done():
+            st.rerun(scope="app")
+        if future is not None:
+            st.info("⏳ Preparing transcript and search indexes... Q&A unlocks when ready.")
+
+    @st.fragment
+    def render_player(self):
+        """Player and timestamp tracking; onProgress ticks rerun only this fragment, not the whole app"""
+        if not st.session_state.get('app_running'):
+            record_rerun('player')
+        event = st_player(
+            st.session_state.video_url,
+            events=["onProgress"],
+            progress_interval=st.session_state.user_preferences['progress_interval'],
+            key="youtube",
+            height=600,
+        )
+        st.session_state.event = event
+        if event is not None and event.name == "onProgress":
+            st.session_state.current_timestamp = event.data.get("playedSeconds", 0)
+
     def render_video_section(self):
         """Render the main video section"""
         st.markdown('<div class="section-header">🎥 YouTube Lecture Player</div>', unsafe_allow_html=True)
@@ -341,20 +591,23 @@ class KriarLearningAssistant:
 
 
             if load_video and video_url:
-                context_extractor = ContextExtractor(video_url)
-                st.session_state.context_extractor = context_extractor
-                video_id = context_extractor.extract_youtube_video_id(video_url)
+                video_id = self.extract_video_id(video_url)
                 if video_id:
                     try:
-                        with st.spinner("🔄 Loading video and extracting transcript..."):
-                            st.session_state.current_video = {
-                                'id': video_id,
-                                'url': video_url,
-                                'loaded_at': datetime.now(),
-                                'metadata': context_extractor.extract_metadata()
-                            }
-
-                            st.session_state.video_loaded = True 
+                        # Transcript, metadata and indexes load in the background; the player shows right away
+                        st.session_state.video_future = get_default_registry().prefetch(video_url)
+                        st.session_state.context_extractor = None
+                        st.session_state.current_video = {
+                            'id': video_id,
+                            'url': video_url,
+                            'loaded_at': datetime.now(),
+                            'metadata': None
+                        }
+
+                        st.session_state.video_loaded = True 
+                        video_session = VideoSession(video_id, "", video_url, datetime.now(), [])
+                        st.session_state.video_sessions.append(video_session)
+                        self.persist("video", asdict(video_session))
                         st.rerun()
                     except Exception as e:
                         st.error(f"❌ Error loading video: {str(e)}")
@@ -363,38 +616,14 @@ class KriarLearningAssistant:
        
         # Display video player
         if st.session_state.current_video:
-            video_id = st.session_state.current_video['id']
-            event = st.session_state.event
-            video_url = st.session_state.video_url
-
-
-            if event is None:
-                event = st_player(
-                    video_url,
-                    events=["onProgress"],
-                    progress_interval=1000,
-                    key="youtube",
-                    height=600,   
-                    
-                )
-                st.session_state.event = event
-            else:
-                event = st_player(
-                    video_url,
-                    events=["onProgress"],
-                    progress_interval=1000,
-                    key="youtube",
-                    height=600,   
-                       
-                )
+            self.render_player()
 
-            st.session_state.event = event
-            if st.session_state.event.name == "onProgress":
-                st.session_state.current_timestamp = st.session_state.event.data.get("playedSeconds", 0)
+            if st.session_state.context_extractor is None:
+                if st.session_state.video_future is not None:
+                    self.render_loading_status()
+                else:
+                    st.warning("⚠️ Transcript unavailable for this video. Reload it to try again.")
             else:
-                st.session_state.current_timestamp = 0
-
-            if st.session_state.context_extractor:
                 metadata = st.session_state.context_extractor.metadata
                 st.markdown(f"""
                 <div class="context-info">
@@ -428,20 +657,14 @@ class KriarLearningAssistant:
         chat_container = st.container(height=400)
         with chat_container:
             if st.session_state.chat_history:
-                for msg in st.session_state.chat_history:
-                    css_class = "user-message" if msg.role == "user" else "assistant-message"
-                    icon = "🧑" if msg.role == "user" else "🤖"
-                    if st.session_state.event.name == "onProgress":
-                        timestamp_info = st.session_state.event.data.get("playedSeconds", 0)
-                    st.markdown(
-                        f"""
-                        <div class="chat-message {css_class}">
-                            <strong>{icon} {msg.role.title()}:</strong><br>
-                            {msg.content}<br>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                # Only the most recent pages are rendered; older turns stay out of the rerun path until asked for
+                history = st.session_state.chat_history
+                shown = min(len(history), st.session_state.chat_pages * CHAT_PAGE_SIZE)
+                hidden = len(history) - shown
+                if hidden and st.button(f"⬆️ Show earlier messages ({hidden} more)", key="chat_show_earlier"):
+                    st.session_state.chat_pages += 1
+                    st.rerun()
+                st.markdown("".join(msg.chat_html for msg in history[hidden:]), unsafe_allow_html=True)
 
             else:
                 st.markdown("""
@@ -467,7 +690,11 @@ class KriarLearningAssistant:
 
             with col2:
                 st.markdown("<br>", unsafe_allow_html=True)
-                submit_chat = st.form_submit_button("🚀 Ask", use_container_width=True)
+                submit_chat = st.form_submit_button(
+                    "🚀 Ask",
+                    use_container_width=True,
+                    disabled=bool(st.session_state.current_video) and st.session_state.context_extractor is None
+                )
 
                 use_timestamp = st.checkbox(
                     "Use current timestamp", 
@@ -480,8 +707,8 @@ class KriarLearningAssistant:
                 st.warning("⚠️ Please load a video first to enable context-aware responses!")
                 return
 
-            # Determine timestamp to use
-            timestamp  = st.session_state.event.data.get("playedSeconds", 0)
+            # Determine timestamp to use: the last position the player fragment reported
+            timestamp = st.session_state.current_timestamp
             st.write(f"Timestamp used: {timestamp}")
 
             # Add user message
@@ -490,33 +717,42 @@ class KriarLearningAssistant:
                 content=user_question,
                 timestamp=datetime.now(),
                 type="text",
-                video_timestamp=timestamp
+                video_timestamp=timestamp,
+                video_id=st.session_state.current_video['id']
             )
-            st.session_state.chat_history.append(user_msg)
+            self.add_chat_message(user_msg)
 
-            # Generate AI response using agent
-            with st.spinner("🤔 Analyzing video context and generating response..."):
-                try:
-                    if st.session_state.agent and st.session_state.context_extractor:
-                        response = st.session_state.agent.execute_task(
+            # Generate AI response using agent, rendering tokens as they arrive
+            try:
+                if st.session_state.agent and st.session_state.context_extractor:
+                    answer = {}
+
+                    def answer_tokens():
+                        # Keep the agent's final answer; text streamed before a tool call is not part of it
+                        answer['text'] = yield from st.session_state.agent.stream_task(
                             query=user_question,
                             video_url=st.session_state.current_video['url'],
                             timestamp=timestamp
-                        ).strip()
-                    else:
-                        response = "Agent not available. Please check your configuration."
+                        )
 
-                except Exception as e:
-                    response = f"Error generating response: {str(e)}"
+                    with chat_container:
+                        st.write_stream(answer_tokens())
+                    response = answer.get('text', '').strip()
+                else:
+                    response = "Agent not available. Please check your configuration."
+
+            except Exception as e:
+                response = f"Error generating response: {str(e)}"
             # Add assistant message
             assistant_msg = ChatMessage(
                 role="assistant", 
                 content=response,
                 timestamp=datetime.now(),
                 type="text",
-                video_timestamp=timestamp
+                video_timestamp=timestamp,
+                video_id=st.session_state.current_video['id']
             )
-            st.session_state.chat_history.append(assistant_msg)
+            self.add_chat_message(assistant_msg)
 
             st.rerun()
 
@@ -556,12 +792,14 @@ class KriarLearningAssistant:
                         timestamp=datetime.now(),
                         type="code"
                     )
-                    st.session_state.code_history.append({
+                    code_entry = {
                         'original_code': user_code,
                         'review': response,
                         'timestamp': datetime.now()
-                    })
-                    st.session_state.chat_history.append(code_msg)
+                    }
+                    st.session_state.code_history.append(code_entry)
+                    self.persist("code", code_entry)
+                    self.add_chat_message(code_msg)
                     st.success("✅ Code reviewed!")
                     time.sleep(1)
                     st.rerun()
@@ -589,7 +827,7 @@ class KriarLearningAssistant:
                         timestamp=datetime.now(),
                         type="code"
                     )
-                    st.session_state.chat_history.append(code_msg)
+                    self.add_chat_message(code_msg)
                     st.success("💡 Help provided!")
                     time.sleep(1)
                     st.rerun()
@@ -619,29 +857,36 @@ class KriarLearningAssistant:
 
     def run(self):
         """Main application runner"""
-        load_css()
+        record_rerun('app')
+        st.session_state.app_running = True
+        try:
+            load_css()
+
+            # Header
+            st.markdown('<h1 class="main-header">📚 Kriar - Learning Assistant</h1>', unsafe_allow_html=True)
+            st.markdown("*An AI Learning Assistant for YouTube Lectures*")
 
-        # Header
-        st.markdown('<h1 class="main-header">📚 Kriar - Learning Assistant</h1>', unsafe_allow_html=True)
-        st.markdown("*An AI Learning Assistant for YouTube Lectures*")
+            self.sync_video_context()
 
-        # Render sidebar
-        self.render_sidebar()
+            # Render sidebar
+            self.render_sidebar()
 
-        # Main content area
-        main_col1, main_col2 = st.columns([2, 1])
+            # Main content area
+            main_col1, main_col2 = st.columns([2, 1])
 
-        with main_col1:
-            self.render_video_section()
+            with main_col1:
+                self.render_video_section()
 
-        with main_col2:
-            tab1, tab2 = st.tabs(["💬 Q&A Chat", "💻 Code Assistant"])
+            with main_col2:
+                tab1, tab2 = st.tabs(["💬 Q&A Chat", "💻 Code Assistant"])
 
-            with tab1:
-                self.render_chat_section()
+                with tab1:
+                    self.render_chat_section()
 
-            with tab2:
-                self.render_code_section()
+                with tab2:
+                    self.render_code_section()
+        finally:
+            st.session_state.app_running = False
 
 def main():
     try:
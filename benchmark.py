@@ -0,0 +1,476 @@
+"""Offline benchmarks for the Kriar pipeline.
+
+Run with ``python benchmark.py`` for the micro-benchmarks, or
+``python benchmark.py --suite --output results.json`` for per-stage p50/p95
+latency, throughput and memory over recorded fixtures from 5 minutes to 4
+hours, written as JSON so runs can be compared across commits
+(``--compare old.json``). Nothing here talks to YouTube or a model provider.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from youtube_transcript_api import FetchedTranscript, FetchedTranscriptSnippet
+
+from agent import KriarLearningAgent
+from bm25_index import BM25Index
+from context_extractor import ContextExtractor, ContextExtractorRegistry
+from embedding_index import EmbeddingIndex
+from fake_models import VOCABULARY, fake_agent
+from metadata_provider import (
+    MetadataService, OEmbedMetadataProvider, YtDlpFastMetadataProvider, YtDlpMetadataProvider, metadata_from_info,
+)
+from transcript_cache import TranscriptCache
+from transcript_index import CompactTranscript
+from yt_dlp.extractor.youtube import YoutubeIE
+
+
+def synthetic_transcript(hours, seed=0, snippet_seconds=3.0):
+    """Deterministic lecture-like transcript of the given length"""
+    rng = random.Random(seed)
+    count = int(hours * 3600 / snippet_seconds)
+    texts = [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 12))) for _ in range(count)]
+    starts = [i * snippet_seconds for i in range(count)]
+    durations = [snippet_seconds] * count
+    return CompactTranscript(starts, durations, texts)
+
+
+def timed(fn, iterations):
+    """Mean seconds per call of fn over iterations runs"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def bench_graph(iterations=50):
+    """Per-request graph overhead: build + compile every time vs the cached graph"""
+    agent = KriarLearningAgent()
+    rebuild = timed(agent.create_graph, iterations)
+    agent.get_graph()
+    cached = timed(agent.get_graph, iterations)
+    return {
+        "rebuild_ms": rebuild * 1000,
+        "cached_ms": cached * 1000,
+        "saved_ms_per_request": (rebuild - cached) * 1000,
+    }
+
+
+def bench_bm25(hours=(0.5, 1, 2, 4), queries=200):
+    """BM25 index build time and query latency over multi-hour transcripts"""
+    rng = random.Random(1)
+    results = []
+    for h in hours:
+        transcript = synthetic_transcript(h)
+        started = time.perf_counter()
+        index = BM25Index(transcript)
+        build_seconds = time.perf_counter() - started
+        latencies = []
+        for _ in range(queries):
+            query = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(2, 6)))
+            started = time.perf_counter()
+            index.search(query, 5)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results.append({
+            "hours": h,
+            "segments": len(transcript),
+            "passages": len(index),
+            "build_ms": build_seconds * 1000,
+            "query_p50_ms": statistics.median(latencies) * 1000,
+            "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        })
+    return results
+
+
+# Recorded https://www.youtube.com/oembed?format=json response, served by the local fixture server
+OEMBED_RESPONSE = {
+    "title": "Lecture 1: Introduction to Deep Learning",
+    "author_name": "Kriar Lectures",
+    "author_url": "https://www.youtube.com/@kriar",
+    "type": "video",
+    "height": 113,
+    "width": 200,
+    "version": "1.0",
+    "provider_name": "YouTube",
+    "provider_url": "https://www.youtube.com/",
+    "thumbnail_height": 360,
+    "thumbnail_width": 480,
+    "thumbnail_url": "https://i.ytimg.com/vi/dQw4w9WgXcQ/hqdefault.jpg",
+    "html": "<iframe width=\"200\" height=\"113\" src=\"https://www.youtube.com/embed/dQw4w9WgXcQ\"></iframe>",
+}
+
+
+def synthetic_video_info(formats=200):
+    """yt-dlp info dict shaped like a YouTube watch page, before format processing"""
+    return {
+        "id": "dQw4w9WgXcQ",
+        "title": OEMBED_RESPONSE["title"],
+        "uploader": OEMBED_RESPONSE["author_name"],
+        "description": "An introduction to neural networks.",
+        "view_count": 12345,
+        "duration": 3600,
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+        "webpage_url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "chapters": [{"title": "Intro", "start_time": 0.0, "end_time": 300.0}],
+        "formats": [
+            {"format_id": str(i), "url": f"https://example.invalid/{i}", "ext": "mp4",
+             "height": 144 + i, "tbr": 100 + i, "vcodec": "avc1", "acodec": "mp4a"}
+            for i in range(formats)
+        ],
+    }
+
+
+def oembed_fixture_server(latency=0.0):
+    """Local HTTP server answering every GET with OEMBED_RESPONSE; returns (server, endpoint)"""
+    body = json.dumps(OEMBED_RESPONSE).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/oembed"
+
+
+@contextmanager
+def recorded_youtube_ie(info):
+    """Make yt-dlp's YouTube extractor return a recorded info dict instead of fetching the watch page"""
+    with mock.patch.object(YoutubeIE, "_real_initialize", lambda self: None), \
+            mock.patch.object(YoutubeIE, "_real_extract", lambda self, url: copy.deepcopy(info)):
+        yield
+
+
+def bench_metadata(iterations=20, formats=200):
+    """Metadata paths offline: both yt-dlp providers on a recorded extractor response vs oEmbed vs the cache"""
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    with recorded_youtube_ie(synthetic_video_info(formats)):
+        full = timed(lambda: YtDlpMetadataProvider().fetch(url), iterations)
+        fast = timed(lambda: YtDlpFastMetadataProvider().fetch(url), iterations)
+        with tempfile.TemporaryDirectory() as directory:
+            service = MetadataService([YtDlpFastMetadataProvider()], cache=TranscriptCache(f"{directory}/cache.sqlite3"))
+            service.get(url, "dQw4w9WgXcQ")
+            cached = timed(lambda: service.get(url, "dQw4w9WgXcQ"), iterations)
+
+    server, endpoint = oembed_fixture_server()
+    try:
+        provider = OEmbedMetadataProvider(endpoint=endpoint)
+        oembed = timed(lambda: provider.fetch(url), iterations)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        "formats": formats,
+        "full_process_ms": full * 1000,
+        "restricted_ms": fast * 1000,
+        "oembed_local_ms": oembed * 1000,
+        "cached_ms": cached * 1000,
+    }
+
+
+def bench_concurrency(requests=20, latency=0.2):
+    """Wall time for a batch of questions: sequential sync execute_task vs concurrent execute_task_async"""
+    agent = fake_agent(latency)
+    started = time.perf_counter()
+    for i in range(requests):
+        agent.execute_task(f"sync question {i} about the lecture topic")
+    sync_seconds = time.perf_counter() - started
+
+    agent = fake_agent(latency)
+
+    async def run_all():
+        await asyncio.gather(*(
+            agent.execute_task_async(f"async question {i} about the lecture topic") for i in range(requests)
+        ))
+
+    started = time.perf_counter()
+    asyncio.run(run_all())
+    async_seconds = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "llm_latency_s": latency,
+        "sync_seconds": sync_seconds,
+        "async_seconds": async_seconds,
+        "sync_rps": requests / sync_seconds,
+        "async_rps": requests / async_seconds,
+    }
+
+
+# Fixture lengths in hours, from a short clip to a long lecture
+FIXTURE_HOURS = {"5m": 5 / 60, "30m": 0.5, "1h": 1.0, "2h": 2.0, "4h": 4.0}
+
+
+def fixture_video_id(label):
+    return f"fixture{label:0>4}"[:11]
+
+
+def recorded_transcript(label, seed=0):
+    """FetchedTranscript shaped like youtube-transcript-api's, for a fixture length"""
+    transcript = synthetic_transcript(FIXTURE_HOURS[label], seed)
+    snippets = [
+        FetchedTranscriptSnippet(text=transcript.text(i), start=transcript.starts[i], duration=transcript.durations[i])
+        for i in range(len(transcript))
+    ]
+    return FetchedTranscript(
+        snippets=snippets, video_id=fixture_video_id(label), language="English", language_code="en", is_generated=True)
+
+
+def recorded_video_info(label):
+    """yt-dlp info dict for a fixture length"""
+    info = synthetic_video_info()
+    info.update(id=fixture_video_id(label), duration=int(FIXTURE_HOURS[label] * 3600))
+    return info
+
+
+class FixtureContextExtractor(ContextExtractor):
+    """ContextExtractor that fetches from recorded fixtures instead of YouTube"""
+
+    fixtures = {}
+
+    def fetch_transcript(self):
+        return self.fixtures[self.video_id][0]
+
+    def load_metadata(self):
+        return metadata_from_info(self.fixtures[self.video_id][1])
+
+
+class FixtureRegistry(ContextExtractorRegistry):
+    """Registry whose loads go through FixtureContextExtractor"""
+
+    def create_extractor(self, url, **kwargs):
+        return FixtureContextExtractor(url, **kwargs)
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))]
+
+
+def stage(fn, samples=20, warmup=1):
+    """p50/p95/mean latency and throughput of fn over samples runs, plus the peak allocation of one traced run"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    # Traced separately since tracemalloc slows every allocation down
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "samples": samples,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "mean_ms": total / samples * 1000,
+        "throughput_per_s": samples / total if total else float("inf"),
+        "peak_alloc_bytes": peak,
+    }
+
+
+def bench_fixture(label, directory, samples=20, latency=0.05, token_rate=0.0):
+    """Every pipeline stage for one fixture length, from transcript load to a streamed answer"""
+    video_id = fixture_video_id(label)
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    FixtureContextExtractor.fixtures[video_id] = (recorded_transcript(label), recorded_video_info(label))
+    cache = TranscriptCache(os.path.join(directory, f"{label}.sqlite3"))
+    rng = random.Random(7)
+    duration = FIXTURE_HOURS[label] * 3600
+
+    def load_cold():
+        cache.delete(video_id)
+        return FixtureContextExtractor(url, cache=cache)
+
+    results = {"load_cold": stage(load_cold, max(samples // 4, 3))}
+    results["load_warm"] = stage(lambda: FixtureContextExtractor(url, cache=cache), max(samples // 4, 3))
+    extractor = FixtureContextExtractor(url, cache=cache)
+    results["extract_context"] = stage(lambda: extractor.extract_context(rng.uniform(0, duration)), samples * 5)
+    results["bm25_build"] = stage(lambda: BM25Index(extractor.transcript), max(samples // 4, 3))
+    results["bm25_search"] = stage(
+        lambda: extractor.search(" ".join(rng.sample(VOCABULARY, 3)), 3), samples * 5)
+    results["embedding_build"] = stage(lambda: EmbeddingIndex.build(extractor.transcript), max(samples // 4, 3))
+    results["embedding_search"] = stage(
+        lambda: extractor.semantic_search(" ".join(rng.sample(VOCABULARY, 3)), 3), samples * 5)
+
+    registry = FixtureRegistry()
+    registry.put(extractor)
+    agent = fake_agent(latency, token_rate, extractors=registry)
+    agent.set_video_context(url)
+    results["assemble_context"] = stage(
+        lambda: agent.assemble_context(extractor, rng.uniform(0, duration), " ".join(rng.sample(VOCABULARY, 4))),
+        samples * 5)
+    results["execute_task"] = stage(
+        lambda: agent.execute_task(f"how does {rng.choice(VOCABULARY)} relate to this part", url, rng.uniform(0, duration)),
+        samples)
+
+    ttfts = []
+
+    def stream():
+        started = time.perf_counter()
+        stream = agent.stream_task(f"explain the {rng.choice(VOCABULARY)} here", url, rng.uniform(0, duration))
+        next(stream)
+        ttfts.append(time.perf_counter() - started)
+        for _ in stream:
+            pass
+
+    results["stream_task"] = stage(stream, samples)
+    ttfts.sort()
+    results["stream_task"]["ttft_p50_ms"] = statistics.median(ttfts) * 1000
+    results["stream_task"]["ttft_p95_ms"] = percentile(ttfts, 0.95) * 1000
+    return {
+        "hours": FIXTURE_HOURS[label],
+        "segments": len(extractor.transcript),
+        "transcript_bytes": extractor.memory_usage(),
+        "stages": results,
+    }
+
+
+def bench_streamlit_reruns(messages=(0, 50, 300), samples=10):
+    """Full-script rerun cost of app.py under AppTest with growing chat histories"""
+    from streamlit.testing.v1 import AppTest
+    from app import ChatMessage
+
+    results = {}
+    for count in messages:
+        at = AppTest.from_file("app.py", default_timeout=60)
+        at.run()
+        at.session_state.chat_history = [
+            ChatMessage(role="user" if i % 2 == 0 else "assistant", content=f"message {i} " + "lecture notes " * 60,
+                        timestamp=datetime.now())
+            for i in range(count)
+        ]
+        results[str(count)] = stage(at.run, samples)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(fixtures=tuple(FIXTURE_HOURS), samples=20, latency=0.05, token_rate=0.0, streamlit=True):
+    """Machine-readable results for every stage and fixture"""
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["KRIAR_EMBEDDING_DIR"] = os.path.join(directory, "embeddings")
+        os.environ["KRIAR_SESSION_PATH"] = os.path.join(directory, "sessions.sqlite3")
+        results = {
+            "revision": git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "config": {"samples": samples, "llm_latency_s": latency, "token_rate": token_rate},
+            "graph": {"create_graph": stage(KriarLearningAgent().create_graph, samples)},
+            "fixtures": {label: bench_fixture(label, directory, samples, latency, token_rate) for label in fixtures},
+        }
+        if streamlit:
+            results["streamlit_reruns"] = bench_streamlit_reruns()
+    return results
+
+
+def print_suite(results):
+    print(f"revision {results['revision']}, {results['config']}")
+    rows = [("graph", name, data) for name, data in results["graph"].items()]
+    for label, fixture in results["fixtures"].items():
+        rows += [(f"{label} ({fixture['segments']} seg)", name, data) for name, data in fixture["stages"].items()]
+    for count, data in results.get("streamlit_reruns", {}).items():
+        rows.append(("streamlit", f"rerun {count} msgs", data))
+    for group, name, data in rows:
+        print(f"{group:<18} {name:<18} p50 {data['p50_ms']:9.3f} ms  p95 {data['p95_ms']:9.3f} ms  "
+              f"{data['throughput_per_s']:9.1f}/s  peak {data['peak_alloc_bytes'] / 1024:9.0f} KiB")
+
+
+def compare_suites(old, new):
+    """Print p50 ratios (new / old) for stages present in both result files"""
+    def flatten(results):
+        flat = {("graph", k): v for k, v in results["graph"].items()}
+        for label, fixture in results["fixtures"].items():
+            flat.update({(label, k): v for k, v in fixture["stages"].items()})
+        flat.update({("streamlit", k): v for k, v in results.get("streamlit_reruns", {}).items()})
+        return flat
+
+    before, after = flatten(old), flatten(new)
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    for key in sorted(before.keys() & after.keys()):
+        ratio = after[key]["p50_ms"] / before[key]["p50_ms"] if before[key]["p50_ms"] else float("inf")
+        print(f"{key[0]:<10} {key[1]:<18} p50 {before[key]['p50_ms']:9.3f} -> {after[key]['p50_ms']:9.3f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM latency in seconds")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="fake LLM tokens per second (0 = instant)")
+    parser.add_argument("--suite", action="store_true", help="run the per-stage suite over the recorded fixtures")
+    parser.add_argument("--fixtures", default=",".join(FIXTURE_HOURS), help="comma-separated fixture lengths")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--no-streamlit", action="store_true", help="skip the AppTest rerun benchmark")
+    parser.add_argument("--output", help="write suite results to this JSON file")
+    parser.add_argument("--compare", help="previous suite JSON to compare against")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite([f for f in args.fixtures.split(",") if f], args.samples, args.latency, args.token_rate,
+                            streamlit=not args.no_streamlit)
+        print_suite(results)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        if args.compare:
+            with open(args.compare) as f:
+                compare_suites(json.load(f), results)
+        return
+
+    result = bench_graph(args.iterations)
+    print(f"graph rebuild per request: {result['rebuild_ms']:.3f} ms")
+    print(f"cached graph per request:  {result['cached_ms']:.5f} ms")
+    print(f"saved per request:         {result['saved_ms_per_request']:.3f} ms")
+
+    for result in bench_bm25():
+        print(f"bm25 {result['hours']}h ({result['segments']} segments): build {result['build_ms']:.1f} ms, "
+              f"query p50 {result['query_p50_ms']:.3f} ms, p95 {result['query_p95_ms']:.3f} ms")
+
+    result = bench_metadata()
+    print(f"metadata, {result['formats']} formats: full processing {result['full_process_ms']:.2f} ms, "
+          f"restricted {result['restricted_ms']:.2f} ms, oEmbed (local fixture) {result['oembed_local_ms']:.2f} ms, "
+          f"cached {result['cached_ms']:.3f} ms")
+
+    result = bench_concurrency(args.requests, args.latency)
+    print(f"{result['requests']} questions, fake LLM latency {result['llm_latency_s']}s per call")
+    print(f"sync sequential:  {result['sync_seconds']:.2f} s ({result['sync_rps']:.1f} req/s)")
+    print(f"async concurrent: {result['async_seconds']:.2f} s ({result['async_rps']:.1f} req/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import heapq
+import math
+import re
+import sys
+from array import array
+
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between
+both but by can could did do does doing down during each few for from further had has have having he her
+here hers him his how i if in into is it its itself just let me more most my no nor not now of off on once
+only or other our out over own same she should so some such than that the their them then there these they
+this those through to too under until up very was we were what when where which while who whom why will
+with would you your yeah okay uh um gonna going right like know
+""".split())
+
+
+def tokenize(text):
+    """Lowercased content words of text"""
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over passages of consecutive transcript segments.
+
+    Built once per CompactTranscript. Each passage covers ``passage_size``
+    segments; the inverted index maps a term to parallel arrays of passage ids
+    and term frequencies.
+    """
+
+    def __init__(self, transcript, passage_size=6, k1=1.5, b=0.75):
+        self.transcript = transcript
+        self.passage_size = passage_size
+        self.k1 = k1
+        self.b = b
+        postings = {}
+        self.lengths = array("l")
+        for passage, first in enumerate(range(0, len(transcript), passage_size)):
+            last = min(first + passage_size, len(transcript))
+            counts = {}
+            terms = tokenize(transcript.join(range(first, last), " "))
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                ids, tfs = postings.setdefault(term, (array("l"), array("l")))
+                ids.append(passage)
+                tfs.append(count)
+            self.lengths.append(len(terms))
+        self.postings = postings
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        passages = len(self.lengths)
+        self.idf = {
+            term: math.log(1 + (passages - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, (ids, _) in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def memory_usage(self):
+        """Approximate bytes held by the postings, idf table and passage lengths"""
+        total = sys.getsizeof(self.postings) + sys.getsizeof(self.idf) + sys.getsizeof(self.lengths)
+        for term, (ids, tfs) in self.postings.items():
+            total += sys.getsizeof(term) + sys.getsizeof(ids) + sys.getsizeof(tfs)
+        return total
+
+    def passage_range(self, passage):
+        """(first, last) segment indices covered by a passage, last exclusive"""
+        first = passage * self.passage_size
+        return first, min(first + self.passage_size, len(self.transcript))
+
+    def scores(self, query):
+        """BM25 score of every passage that shares a term with the query"""
+        scores = {}
+        if not self.average_length:
+            return scores
+        k1, b, lengths, average = self.k1, self.b, self.lengths, self.average_length
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            idf = self.idf[term]
+            for passage, tf in zip(*posting):
+                norm = k1 * (1 - b + b * lengths[passage] / average)
+                scores[passage] = scores.get(passage, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=5):
+        """Top passages for query as dicts with segment range, times and score"""
+        best = heapq.nlargest(top_k, self.scores(query).items(), key=lambda item: item[1])
+        results = []
+        for passage, score in best:
+            first, last = self.passage_range(passage)
+            results.append({
+                'first_segment': first,
+                'last_segment': last,
+                'start': self.transcript.starts[first],
+                'end': self.transcript.starts[last - 1] + self.transcript.durations[last - 1],
+                'score': score,
+            })
+        return results
@@ -0,0 +1,178 @@
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.schema import HumanMessage
+
+from bm25_index import tokenize
+from context_assembler import count_tokens
+from conversation_memory import key_sentences, truncate_tokens
+from telemetry import get_telemetry
+from transcript_index import format_timestamp
+
+# Auto-segmented chapters are cut at the weakest topic shift within this span of seconds
+MIN_CHAPTER_SECONDS = 180.0
+MAX_CHAPTER_SECONDS = 600.0
+BLOCK_SECONDS = 30.0
+
+CHAPTERS_PER_BATCH = 8
+CHAPTER_PROMPT_TOKENS = 1200
+SUMMARY_TOKENS = 80
+
+_NUMBERED_RE = re.compile(r"^\s*(\d+)[.):]\s*(.+)$")
+
+
+def _similarity(a, b):
+    """Cosine similarity of two term counters"""
+    dot = sum(count * b.get(term, 0) for term, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def topic_boundaries(transcript, min_seconds=MIN_CHAPTER_SECONDS, max_seconds=MAX_CHAPTER_SECONDS,
+                     block_seconds=BLOCK_SECONDS):
+    """Segment indices that start a new chapter, TextTiling style.
+
+    The transcript is grouped into blocks of ``block_seconds``; each block boundary
+    is scored by the vocabulary overlap of the two blocks either side of it, and
+    chapters are cut at the lowest-overlap boundary between ``min_seconds`` and
+    ``max_seconds`` after the previous cut.
+    """
+    starts = transcript.starts
+    blocks = []
+    for i, start in enumerate(starts):
+        if not blocks or start - starts[blocks[-1][0]] >= block_seconds:
+            blocks.append([i, Counter()])
+        blocks[-1][1].update(tokenize(transcript.text(i)))
+
+    scores = {}
+    for b in range(1, len(blocks)):
+        before = blocks[max(0, b - 2)][1] + blocks[b - 1][1]
+        after = blocks[b][1] + (blocks[b + 1][1] if b + 1 < len(blocks) else Counter())
+        scores[blocks[b][0]] = _similarity(before, after)
+
+    end = starts[-1] + transcript.durations[-1]
+    cuts = [0]
+    while end - starts[cuts[-1]] > max_seconds:
+        last = starts[cuts[-1]]
+        candidates = [i for i in scores if last + min_seconds <= starts[i] <= last + max_seconds
+                      and end - starts[i] >= min_seconds]
+        if not candidates:
+            break
+        cuts.append(min(candidates, key=lambda i: (scores[i], i)))
+    return cuts
+
+
+def segment_chapters(transcript, chapters=None, **kwargs):
+    """Chapters as {"title", "start", "end", "first_segment", "last_segment"} dicts.
+
+    Uses the video's own chapter markers (yt-dlp metadata) when there are any,
+    otherwise topic boundaries found in the transcript.
+    """
+    if not transcript:
+        return []
+    starts = transcript.starts
+    end = starts[-1] + transcript.durations[-1]
+    if chapters:
+        bounds = [(c.get("title") or f"Part {n + 1}", float(c.get("start") or 0.0)) for n, c in enumerate(chapters)]
+    else:
+        cuts = topic_boundaries(transcript, **kwargs)
+        bounds = [(f"Part {n + 1}", 0.0 if n == 0 else starts[i]) for n, i in enumerate(cuts)]
+
+    segmented = []
+    for n, (title, start) in enumerate(bounds):
+        stop = bounds[n + 1][1] if n + 1 < len(bounds) else end
+        first = bisect_left(starts, start) if n else 0
+        last = bisect_left(starts, stop) if n + 1 < len(bounds) else len(starts)
+        if last > first:
+            segmented.append({
+                "title": title, "start": start, "end": stop, "first_segment": first, "last_segment": last,
+            })
+    return segmented
+
+
+def chapter_text(transcript, chapter, max_tokens=CHAPTER_PROMPT_TOKENS):
+    return truncate_tokens(
+        transcript.join(range(chapter["first_segment"], chapter["last_segment"]), " ").strip(), max_tokens)
+
+
+def local_chapter_summarizer(texts):
+    """Key sentences of each chapter, truncated for unpunctuated captions; no model call"""
+    return [truncate_tokens(" ".join(key_sentences(text, 3)), SUMMARY_TOKENS) for text in texts]
+
+
+def model_chapter_summarizer(model, batch_size=CHAPTERS_PER_BATCH, max_workers=4):
+    """Summarizer that asks a chat model for several chapter summaries per call, batches in parallel.
+
+    A batch that fails or whose reply cannot be parsed yields None for each of
+    its chapters.
+    """
+    def summarize_batch(texts):
+        numbered = "\n\n".join(f"Chapter {n + 1}:\n{text}" for n, text in enumerate(texts))
+        prompt = f"""
+            Summarize each chapter of this lecture transcript in two or three sentences covering the
+            concepts taught. Reply with one numbered line per chapter ("1. ...") and nothing else.
+
+            {numbered}
+            """
+        messages = [HumanMessage(content=prompt)]
+        with get_telemetry().span("chapter_summary_batch", chapters=len(texts)) as span:
+            reply = model.invoke(messages).content
+            span["tokens_in"] = count_tokens(prompt)
+            span["tokens_out"] = count_tokens(reply)
+        lines = {}
+        for line in reply.splitlines():
+            match = _NUMBERED_RE.match(line)
+            if match:
+                lines[int(match.group(1))] = truncate_tokens(match.group(2).strip(), SUMMARY_TOKENS)
+        if not all(n + 1 in lines for n in range(len(texts))):
+            raise ValueError("unparseable chapter summary reply")
+        return [lines[n + 1] for n in range(len(texts))]
+
+    def run(batch):
+        try:
+            return summarize_batch(batch)
+        except Exception:
+            return [None] * len(batch)
+
+    def summarize(texts):
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kriar-chapters") as pool:
+            return [summary for batch in pool.map(run, batches) for summary in batch]
+
+    return summarize
+
+
+def build_chapter_summaries(transcript, metadata, summarizer=local_chapter_summarizer):
+    """(chapters with a "summary" each, whether the summarizer produced all of them).
+
+    Chapters the summarizer returned None for get key sentences instead.
+    """
+    chapters = segment_chapters(transcript, (metadata or {}).get("chapters"))
+    texts = [chapter_text(transcript, chapter) for chapter in chapters]
+    summaries = summarizer(texts)
+    complete = all(summary is not None for summary in summaries)
+    return [
+        {**chapter, "summary": summary if summary is not None else local_chapter_summarizer([text])[0]}
+        for chapter, text, summary in zip(chapters, texts, summaries)
+    ], complete
+
+
+def render_outline(chapters, timestamp, max_tokens):
+    """Summaries of the chapters up to timestamp, most recent kept first when the budget runs out"""
+    seen = [c for c in chapters if c["start"] <= timestamp] or chapters[:1]
+    lines = []
+    used = count_tokens("Lecture so far:")
+    for chapter in reversed(seen):
+        current = " (current)" if chapter["start"] <= timestamp < chapter["end"] else ""
+        line = f"[{format_timestamp(chapter['start'])}] {chapter['title']}{current}: {chapter['summary']}"
+        cost = count_tokens(line)
+        if used + cost > max_tokens:
+            break
+        used += cost
+        lines.append(line)
+    if not lines:
+        return ""
+    return "Lecture so far:\n" + "\n".join(reversed(lines))
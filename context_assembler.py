@@ -0,0 +1,104 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+from transcript_index import format_timestamp
+
+# Transcript-context token budgets. Small, fast models get tight budgets so the
+# context stays a fraction of their window and of the per-request cost.
+PROVIDER_TOKEN_BUDGETS = {
+    "openai": 2500,
+    "groq": 1500,
+    "google": 4000,
+}
+MODEL_TOKEN_BUDGETS = {
+    ("openai", "gpt-3.5-turbo"): 1500,
+    ("groq", "openai/gpt-oss-20b"): 1500,
+    ("groq", "llama-3.1-8b-instant"): 1000,
+}
+DEFAULT_TOKEN_BUDGET = 1500
+RELATED_HEADER = "Related parts of the lecture:"
+
+# Words split into pieces of up to four characters, punctuation counted separately:
+# close to BPE counts for English without loading a tokenizer.
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Fast approximate token count"""
+    return len(_TOKEN_RE.findall(text))
+
+
+def token_budget_for(model_provider: str, model_name: str) -> int:
+    """Context token budget for a provider/model pair"""
+    return MODEL_TOKEN_BUDGETS.get(
+        (model_provider, model_name),
+        PROVIDER_TOKEN_BUDGETS.get(model_provider, DEFAULT_TOKEN_BUDGET),
+    )
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens: int
+    naive_tokens: int
+    segments: List[int] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.naive_tokens - self.tokens, 0)
+
+
+class ContextAssembler:
+    """Builds prompt context from transcript segments and retrieval hits under a token budget.
+
+    Window segments are ranked by distance from the player position, retrieval
+    hits keep the order they are given in; anything overlapping already chosen
+    segments is dropped, and candidates that would overrun the budget are skipped.
+    An optional outline (chapter summaries) goes first and is paid for up front.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, counter=count_tokens):
+        self.token_budget = token_budget
+        self.counter = counter
+
+    def assemble(self, transcript, window, target, hits=(), outline=""):
+        """AssembledContext for window segment indices around target plus retrieval hits"""
+        count = self.counter
+        starts = transcript.starts
+        used = count(outline) if outline else 0
+        covered = set()
+        naive_tokens = used
+
+        chosen = []
+        for i in sorted(window, key=lambda i: (abs(starts[i] - target), i)):
+            cost = count(transcript.text(i))
+            naive_tokens += cost
+            if used + cost > self.token_budget:
+                continue
+            used += cost
+            chosen.append(i)
+            covered.add(i)
+
+        passages = []
+        header_cost = count(RELATED_HEADER)
+        for hit in hits:
+            segments = range(hit['first_segment'], hit['last_segment'])
+            passage = f"[{format_timestamp(hit['start'])}] {transcript.join(segments, ' ').strip()}"
+            cost = count(passage)
+            naive_tokens += cost
+            # The first passage also pays for the header introducing them
+            cost += 0 if passages else header_cost
+            if any(i in covered for i in segments) or used + cost > self.token_budget:
+                continue
+            used += cost
+            covered.update(segments)
+            passages.append((hit['start'], passage))
+
+        text = transcript.join(sorted(chosen), " ").strip()
+        if passages:
+            related = "\n".join(passage for _, passage in sorted(passages))
+            text = f"{text}\n\n{RELATED_HEADER}\n{related}" if text else f"{RELATED_HEADER}\n{related}"
+        if outline:
+            text = f"{outline}\n\n{text}" if text else outline
+        return AssembledContext(text=text, tokens=count(text), naive_tokens=naive_tokens, segments=sorted(covered))
@@ -2,9 +2,40 @@ from pytube import YouTube
 from youtube_transcript_api import YouTubeTranscriptApi
 from urllib.parse import urlparse, parse_qs
 from datetime import timedelta
-from yt_dlp import YoutubeDL
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextvars
+import logging
+import threading
+from transcript_cache import get_default_cache
+from transcript_index import CompactTranscript, TranscriptIndex
+from bm25_index import BM25Index
+from embedding_index import EmbeddingIndex
+from metadata_provider import get_metadata_service
+from chapter_summaries import build_chapter_summaries, local_chapter_summarizer, render_outline
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+
+def extract_youtube_video_id(url):
+    """Extract YouTube video ID from URL"""
+    try:
+        parsed_url = urlparse(url)
+        if parsed_url.hostname in ["www.youtube.com", "youtube.com"]:
+            query = parse_qs(parsed_url.query)
+            return query.get("v", [None])[0]
+        elif parsed_url.hostname == "youtu.be":
+            return parsed_url.path[1:]
+        return None
+    except Exception as e:
+        return None
+
+# Transcript and metadata fetches run side by side on this pool
+_io_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="kriar-io")
+
 class ContextExtractor:
-    def __init__(self, url, target_timestamp=0, num_segments=20, context_window=10.0):
+    def __init__(self, url, target_timestamp=0, num_segments=20, context_window=10.0, cache=None):
         self.url = url
         self.video_id = self.extract_youtube_video_id(url)
         if not self.video_id:
@@ -13,50 +44,83 @@ class ContextExtractor:
         self.target_timestamp = target_timestamp
         self.num_segments = num_segments
         self.context_window = context_window
-        self.transcript = self.fetch_transcript()
-        self.metadata = self.extract_metadata()
+        self.cache = cache if cache is not None else get_default_cache()
+        metadata_future = _io_executor.submit(contextvars.copy_context().run, self.load_metadata)
+        self.transcript = self.load_transcript()
+        self.metadata = metadata_future.result()
+        self.index = TranscriptIndex(self.transcript) if self.transcript else None
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+        self.chapters = None
 
     def extract_youtube_video_id(self,url):
         """Extract YouTube video ID from URL"""
-        try:
-            parsed_url = urlparse(self.url)
-            if parsed_url.hostname in ["www.youtube.com", "youtube.com"]:
-                query = parse_qs(parsed_url.query)
-                return query.get("v", [None])[0]
-            elif parsed_url.hostname == "youtu.be":
-                return parsed_url.path[1:]
-            return None
-        except Exception as e:
-            return None
+        return extract_youtube_video_id(url)
 
-    def extract_metadata(self):
-        """Extract video metadata using pytube"""
-        try:
-            data = {}
-            opts = {}
-            with YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(self.url, download=False)
-                data["title"] = info.get("title")
-                data["author"] = info.get("uploader")
-                data["description"] = str(info.get("description","")).strip()
-                data["views"] = info.get("view_count")
-            return data
-        except Exception as e:
-            return {"title": "Unknown", "author": "Unknown", "description": "", "length": "Unknown"}
+    def load_metadata(self):
+        """Return metadata from the cache, trying the fast providers before full extraction on a miss"""
+        with get_telemetry().span("metadata_load", video_id=self.video_id):
+            return get_metadata_service(self.cache).get(self.url, self.video_id)
 
-    def fetch_transcript(self):
-        """Fetch transcript using YouTube Transcript API"""
-        try:
-            ytt = YouTubeTranscriptApi()
-            transcript = ytt.fetch(self.video_id)
+    def load_transcript(self):
+        """Return the transcript from the cache, fetching it on a miss"""
+        with get_telemetry().span("transcript_load", video_id=self.video_id) as span:
+            cached = self.cache.get("transcript", self.video_id)
+            span["cache_hit"] = cached is not None
+            transcript = self._load_transcript(cached)
+            span["segments"] = len(transcript)
             return transcript
-        except Exception as e:
+
+    def _load_transcript(self, cached):
+        if cached is not None:
+            return CompactTranscript.from_rows(
+                cached["snippets"],
+                language=cached.get("language", ""),
+                language_code=cached.get("language_code", ""),
+                is_generated=cached.get("is_generated", False),
+            )
+        fetched = self.fetch_transcript()
+        if not fetched:
             return []
+        # Keep only the compact columns; the FetchedTranscript is dropped here
+        transcript = CompactTranscript.from_snippets(
+            fetched.snippets,
+            language=fetched.language,
+            language_code=fetched.language_code,
+            is_generated=fetched.is_generated,
+        )
+        self.cache.set("transcript", self.video_id, {
+            "language": transcript.language,
+            "language_code": transcript.language_code,
+            "is_generated": transcript.is_generated,
+            "snippets": transcript.to_rows(),
+        })
+        return transcript
+
+    def cache_stats(self):
+        """Hit/miss counts of the transcript cache"""
+        return self.cache.stats()
+
+    def fetch_transcript(self):
+        """Fetch transcript using YouTube Transcript API"""
+        with get_telemetry().span("transcript_fetch", video_id=self.video_id) as span:
+            try:
+                ytt = YouTubeTranscriptApi()
+                transcript = ytt.fetch(self.video_id)
+                return transcript
+            except Exception as e:
+                span["error"] = type(e).__name__
+                logger.warning("Transcript fetch failed for %s: %s", self.video_id, e)
+                return []
 
     def extract_context(self, target_timestamp=None):
         """Extract relevant context segments from transcript based on target timestamp"""
         if target_timestamp is not None:
             self.target_timestamp = target_timestamp
+        else:
+            target_timestamp = self.target_timestamp
 
         if not self.transcript:
             return {
@@ -67,18 +131,7 @@ class ContextExtractor:
             }
 
 
-        all_segments = []
-        for snippet in self.transcript.snippets:
-            segment = {
-                'text': snippet.text,
-                'start': snippet.start,
-                'duration': snippet.duration,
-                'end': snippet.start + snippet.duration,
-                'distance_from_target': abs(snippet.start - self.target_timestamp)
-            }
-            all_segments.append(segment)
-
-        if not all_segments:
+        if not self.index:
             return {
                 'error': 'No segments found in transcript',
                 'target_timestamp': self.target_timestamp,
@@ -86,40 +139,255 @@ class ContextExtractor:
                 'metadata': self.metadata
             }
 
+        selected = self.index.select(target_timestamp, self.num_segments, self.context_window)
+        return [self.index.segment(i, target_timestamp) for i in selected]
 
-        all_segments.sort(key=lambda x: x['start'])
+    def select_segment_indices(self, timestamp):
+        """Positions (in start order) of the segments extract_context picks for timestamp"""
+        if not self.index:
+            return []
+        return self.index.select(timestamp, self.num_segments, self.context_window)
 
+    def get_context_at_timestamp(self, timestamp):
+        """Get context for a specific timestamp"""
+        if not self.index:
+            return ""
+        return self.transcript.join(self.select_segment_indices(timestamp), " ").strip()
 
-        relevant_segments = []
-        for segment in all_segments:
-            segment_center = segment['start'] + (segment['duration'] / 2)
-            if abs(segment_center - self.target_timestamp) <= self.context_window:
-                relevant_segments.append(segment)
+    def get_full_transcript_text(self):
+        """Get full transcript as text"""
+        if not self.transcript:
+            return ""
+        return self.transcript.full_text()
 
-        if not relevant_segments:
-            all_segments.sort(key=lambda x: x['distance_from_target'])
-            relevant_segments = all_segments[:self.num_segments * 2]
+    @property
+    def bm25(self):
+        """Lexical index over the whole transcript, built on first use"""
+        if self._bm25 is None and self.transcript:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    with get_telemetry().span("bm25_build", video_id=self.video_id):
+                        self._bm25 = BM25Index(self.transcript)
+        return self._bm25
 
-        relevant_segments.sort(key=lambda x: (x['distance_from_target'], x['start']))
-        selected_segments = relevant_segments[:self.num_segments]
+    def search(self, query, top_k=5):
+        """Transcript passages from anywhere in the video that best match query"""
+        if not self.transcript or not query:
+            return []
+        with get_telemetry().span("bm25_search"):
+            return self.bm25.search(query, top_k)
 
-        selected_segments.sort(key=lambda x: x['start'])
+    @property
+    def embeddings(self):
+        """Dense chunk vectors for the transcript, loaded from disk or built on first use"""
+        if self._embeddings is None and self.transcript:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    with get_telemetry().span("embedding_load", video_id=self.video_id):
+                        self._embeddings = EmbeddingIndex.load_or_build(self.transcript, self.video_id)
+        return self._embeddings
 
+    def semantic_search(self, query, top_k=5):
+        """Transcript chunks from anywhere in the video closest in meaning to query"""
+        if not self.transcript or not query:
+            return []
+        with get_telemetry().span("semantic_search"):
+            return self.embeddings.search(query, top_k)
 
-        closest_segment = min(relevant_segments, key=lambda x: x['distance_from_target']) if relevant_segments else None
+    def warm_indexes(self):
+        """Build the retrieval indexes ahead of the first question"""
+        try:
+            self.bm25
+            self.embeddings
+        except Exception as e:
+            logger.warning("Index warm-up failed for %s: %s", self.video_id, e)
 
-        return selected_segments
+    def summarize_chapters(self, summarizer=local_chapter_summarizer):
+        """Per-chapter summaries from the cache, building them on a miss.
 
-    def get_context_at_timestamp(self, timestamp):
-        """Get context for a specific timestamp"""
-        result = self.extract_context(timestamp)
-        text = ""
-        for i in result:
-            text += i['text']
-        return text.strip()
+        Only complete results are cached, so chapters that fell back to key
+        sentences are summarized again on a later load.
+        """
+        if self.chapters is not None or not self.transcript:
+            return self.chapters
+        with get_telemetry().span("chapter_summaries", video_id=self.video_id) as span:
+            chapters = self.cache.get("chapters", self.video_id)
+            span["cache_hit"] = chapters is not None
+            if chapters is None:
+                chapters, complete = build_chapter_summaries(self.transcript, self.metadata, summarizer)
+                if complete:
+                    self.cache.set("chapters", self.video_id, chapters)
+            span["chapters"] = len(chapters)
+        self.chapters = chapters
+        return chapters
 
-    def get_full_transcript_text(self):
-        """Get full transcript as text"""
-        if not self.transcript:
+    def chapter_outline(self, timestamp, max_tokens):
+        """Summaries of the chapters watched up to timestamp, or "" before they are ready"""
+        if not self.chapters:
             return ""
-        return ' '.join([snippet['text'] for snippet in self.transcript])
+        return render_outline(self.chapters, timestamp, max_tokens)
+
+    def memory_usage(self):
+        """Approximate bytes held by the loaded transcript and whichever indexes are built"""
+        if not self.transcript:
+            return 0
+        total = self.transcript.memory_usage() + self.index.memory_usage()
+        if self._bm25 is not None:
+            total += self._bm25.memory_usage()
+        if self._embeddings is not None:
+            total += self._embeddings.memory_usage()
+        return total
+
+
+class ContextExtractorRegistry:
+    """Keeps one loaded ContextExtractor per video ID so repeat questions skip the network.
+
+    Holds at most ``max_videos`` extractors using at most ``max_bytes`` of memory for
+    transcripts and their retrieval indexes, dropping the least recently used ones
+    when a new video goes past either cap.
+    Loads run on a background pool and concurrent requests for the same video share
+    one load; index warm-ups, which are CPU-bound, and chapter summaries, which wait
+    on model calls, each get a pool of their own so they never hold up a load.
+    """
+
+    def __init__(self, max_videos=16, max_bytes=512 * 1024 * 1024, max_workers=4, summary_workers=2,
+                 index_workers=1):
+        self.max_videos = max_videos
+        self.max_bytes = max_bytes
+        self._extractors = OrderedDict()
+        self._inflight = {}
+        self._summarizing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kriar-prefetch")
+        self._summary_executor = ThreadPoolExecutor(max_workers=summary_workers, thread_name_prefix="kriar-summaries")
+        self._index_executor = ThreadPoolExecutor(max_workers=index_workers, thread_name_prefix="kriar-indexes")
+
+    def get(self, video_id):
+        """Return the loaded extractor for a video ID, if any"""
+        with self._lock:
+            extractor = self._extractors.get(video_id)
+            if extractor is not None:
+                self._extractors.move_to_end(video_id)
+            return extractor
+
+    def get_or_create(self, url, **kwargs):
+        """Return the extractor for the video at url, loading it on first use"""
+        video_id = extract_youtube_video_id(url)
+        if not video_id:
+            raise ValueError(f"Could not extract video ID from URL: {url}")
+        extractor = self.get(video_id)
+        if extractor is None:
+            extractor = self.prefetch(url, **kwargs).result()
+        return extractor
+
+    def prefetch(self, url, **kwargs):
+        """Start loading the video in the background and return a Future for its extractor"""
+        video_id = extract_youtube_video_id(url)
+        if not video_id:
+            raise ValueError(f"Could not extract video ID from URL: {url}")
+        with self._lock:
+            extractor = self._extractors.get(video_id)
+            if extractor is not None:
+                future = Future()
+                future.set_result(extractor)
+                return future
+            future = self._inflight.get(video_id)
+            if future is None:
+                future = self._executor.submit(self._load, video_id, url, kwargs)
+                self._inflight[video_id] = future
+            return future
+
+    def create_extractor(self, url, **kwargs):
+        """Fetch a new extractor for the video at url; subclasses override this to load from elsewhere"""
+        return ContextExtractor(url, **kwargs)
+
+    def _load(self, video_id, url, kwargs):
+        try:
+            extractor = self.create_extractor(url, **kwargs)
+            # Without a transcript the fetch most likely failed; leave it unregistered so the next question retries
+            if extractor.transcript:
+                extractor = self.put(extractor)
+        finally:
+            with self._lock:
+                self._inflight.pop(video_id, None)
+        if extractor.transcript:
+            self._index_executor.submit(extractor.warm_indexes)
+        return extractor
+
+    def summarize_chapters(self, extractor, summarizer):
+        """Build the video's chapter summaries in the background, once per video"""
+        with self._lock:
+            if extractor.chapters is not None or extractor.video_id in self._summarizing:
+                return
+            self._summarizing.add(extractor.video_id)
+
+        def run():
+            try:
+                extractor.summarize_chapters(summarizer)
+            except Exception as e:
+                logger.warning("Chapter summaries failed for %s: %s", extractor.video_id, e)
+            finally:
+                with self._lock:
+                    self._summarizing.discard(extractor.video_id)
+
+        self._summary_executor.submit(run)
+
+    def is_loading(self, video_id):
+        """Whether a background load for the video is still running"""
+        with self._lock:
+            return video_id in self._inflight
+
+    def put(self, extractor):
+        """Register a loaded extractor, returning the one kept for its video ID"""
+        with self._lock:
+            existing = self._extractors.get(extractor.video_id)
+            if existing is not None:
+                self._extractors.move_to_end(extractor.video_id)
+                return existing
+            self._extractors[extractor.video_id] = extractor
+            while len(self._extractors) > self.max_videos:
+                self._extractors.popitem(last=False)
+            if self.max_bytes is not None:
+                while len(self._extractors) > 1 and self._memory_usage() > self.max_bytes:
+                    self._extractors.popitem(last=False)
+            return extractor
+
+    def _memory_usage(self):
+        return sum(e.memory_usage() for e in self._extractors.values())
+
+    def memory_usage(self):
+        """Approximate bytes held by every registered transcript and its indexes"""
+        with self._lock:
+            return self._memory_usage()
+
+    def invalidate(self, video_id=None, purge_cache=False):
+        """Forget one video (or all of them), optionally dropping its on-disk cache entries"""
+        with self._lock:
+            if video_id is None:
+                removed = list(self._extractors.values())
+                self._extractors.clear()
+            else:
+                removed = [self._extractors.pop(video_id)] if video_id in self._extractors else []
+        if purge_cache:
+            for extractor in removed:
+                extractor.cache.delete(extractor.video_id)
+                EmbeddingIndex.delete(extractor.video_id)
+            if video_id is not None and not removed:
+                get_default_cache().delete(video_id)
+                EmbeddingIndex.delete(video_id)
+
+    def __contains__(self, video_id):
+        with self._lock:
+            return video_id in self._extractors
+
+    def __len__(self):
+        with self._lock:
+            return len(self._extractors)
+
+
+_default_registry = ContextExtractorRegistry()
+
+
+def get_default_registry():
+    """Process-wide registry shared by every agent and Streamlit session"""
+    return _default_registry
@@ -0,0 +1,195 @@
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.schema import HumanMessage, AIMessage
+
+from bm25_index import tokenize
+from context_assembler import count_tokens
+
+DEFAULT_MEMORY_TOKEN_BUDGET = 1000
+
+# Summaries are compressed off the request path on this pool
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kriar-memory")
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+
+
+def truncate_tokens(text, max_tokens):
+    """Longest word prefix of text within max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid])) <= max_tokens - 1:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + "…"
+
+
+def key_sentences(text, count=2):
+    """The count sentences of text with the most frequent content words, in original order"""
+    sentences = [s.strip() for s in _SENTENCE_RE.split(text.strip()) if s.strip()]
+    if len(sentences) <= count:
+        return sentences
+    frequency = {}
+    for word in tokenize(text):
+        frequency[word] = frequency.get(word, 0) + 1
+
+    def score(i):
+        words = tokenize(sentences[i])
+        return sum(frequency[w] for w in words) / (len(words) + 1)
+
+    best = sorted(range(len(sentences)), key=score, reverse=True)[:count]
+    return [sentences[i] for i in sorted(best)]
+
+
+def local_summarizer(summary, turns, max_tokens):
+    """Append one line per turn (question plus the answer's key sentences), dropping the oldest lines to fit"""
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        lines.append(f"- Q: {truncate_tokens(question, 40)} A: {' '.join(key_sentences(answer))}")
+    lines = [truncate_tokens(line, max_tokens) for line in lines]
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def model_summarizer(model):
+    """Summarizer that asks a (cheap) chat model to fold new turns into the running summary"""
+    def summarize(summary, turns, max_tokens):
+        transcript = "\n".join(f"Student: {q}\nAssistant: {a}" for q, a in turns)
+        prompt = f"""
+            Update the running summary of a tutoring conversation about a video lecture.
+            Keep what the student asked, the key facts given and any open questions, in at most {max_tokens * 3 // 4} words.
+
+            Current summary: {summary or "(empty)"}
+
+            New turns:
+            {transcript}
+            """
+        return truncate_tokens(model.invoke([HumanMessage(content=prompt)]).content.strip(), max_tokens)
+    return summarize
+
+
+class ConversationMemory:
+    """Recent turns verbatim plus a running summary of older ones, under a fixed token budget.
+
+    A third of the budget goes to the summary and the rest to the window of
+    recent turns. Turns pushed out of the window are folded into the summary in
+    the background; until that finishes they are kept as pending turns so the
+    next prompt does not lose them.
+    """
+
+    def __init__(self, token_budget=DEFAULT_MEMORY_TOKEN_BUDGET, window_turns=4, summarizer=local_summarizer,
+                 executor=_summary_executor):
+        self.token_budget = token_budget
+        self.summary_budget = token_budget // 3
+        self.window_budget = token_budget - self.summary_budget
+        self.window_turns = window_turns
+        self.summarizer = summarizer
+        self.executor = executor
+        self.summary = ""
+        self.turns = deque()
+        self.pending = []
+        self.compressions = 0
+        self._compressing = None
+        self._lock = threading.Lock()
+
+    def add_turn(self, question, answer):
+        """Record a finished question/answer pair, evicting old turns into the summary"""
+        question = truncate_tokens(question, self.window_budget // 4)
+        answer = truncate_tokens(answer, self.window_budget // 2)
+        with self._lock:
+            self.turns.append((question, answer, count_tokens(question) + count_tokens(answer)))
+            while len(self.turns) > 1 and (len(self.turns) > self.window_turns or self.window_tokens() > self.window_budget):
+                question, answer, _ = self.turns.popleft()
+                self.pending.append((question, answer))
+            if self.pending and self._compressing is None:
+                self._compressing = self.executor.submit(self._compress)
+
+    def _compress(self):
+        while True:
+            with self._lock:
+                turns, summary = self.pending[:], self.summary
+                if not turns:
+                    self._compressing = None
+                    return
+            try:
+                summary = self.summarizer(summary, turns, self.summary_budget)
+            except Exception:
+                summary = local_summarizer(summary, turns, self.summary_budget)
+            with self._lock:
+                self.summary = summary
+                del self.pending[:len(turns)]
+                self.compressions += 1
+
+    def wait(self):
+        """Block until background compression has caught up"""
+        while True:
+            with self._lock:
+                future = self._compressing
+            if future is None:
+                return
+            future.result()
+
+    def window_tokens(self):
+        return sum(tokens for _, _, tokens in self.turns)
+
+    def summary_text(self):
+        """Running summary plus any turns still waiting to be compressed, within the summary budget"""
+        with self._lock:
+            summary, pending = self.summary, self.pending[:]
+        if pending:
+            summary = local_summarizer(summary, pending, self.summary_budget)
+        return summary
+
+    def messages(self):
+        """Messages to put in front of the executor prompt"""
+        summary = self.summary_text()
+        messages = [HumanMessage(content=f"{SUMMARY_PREFIX}{summary}")] if summary else []
+        with self._lock:
+            for question, answer, _ in self.turns:
+                messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return messages
+
+    def load(self, messages):
+        """Replace the memory with the summary and turns of a messages() snapshot"""
+        messages = list(messages)
+        summary = ""
+        if messages and messages[0].content.startswith(SUMMARY_PREFIX):
+            summary = messages.pop(0).content[len(SUMMARY_PREFIX):]
+        with self._lock:
+            self.summary = summary
+            self.pending.clear()
+            self.turns = deque(
+                (question.content, answer.content, count_tokens(question.content) + count_tokens(answer.content))
+                for question, answer in zip(messages[::2], messages[1::2])
+            )
+
+    def render(self):
+        """The memory as plain text for prompts that take a single string"""
+        summary = self.summary_text()
+        with self._lock:
+            recent = "\n".join(f"Student: {q}\nAssistant: {a}" for q, a, _ in self.turns)
+        return "\n".join(part for part in (summary, recent) if part)
+
+    def tokens(self):
+        """Tokens the memory currently adds to a prompt"""
+        return sum(count_tokens(message.content) for message in self.messages())
+
+    def __len__(self):
+        with self._lock:
+            return len(self.turns)
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.turns.clear()
+            self.pending.clear()
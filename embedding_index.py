@@ -0,0 +1,233 @@
+import glob
+import hashlib
+import os
+import re
+import zlib
+
+import numpy as np
+
+from bm25_index import tokenize
+
+DEFAULT_EMBEDDING_DIR = os.path.join(os.path.expanduser("~"), ".cache", "kriar", "embeddings")
+DEFAULT_EMBEDDING_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and word bigrams; CPU-only, no model download"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def features(self, text):
+        words = tokenize(text)
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        """L2-normalized float32 matrix with one row per text"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        if rows:
+            np.add.at(matrix, (np.array(rows), np.array(cols)), np.array(signs, dtype=np.float32))
+        return normalize_rows(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Small local sentence-transformers model, e.g. all-MiniLM-L6-v2, run on CPU"""
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+_default_embedder = None
+
+
+def get_default_embedder():
+    """Embedder named by KRIAR_EMBEDDING_MODEL, falling back to feature hashing"""
+    global _default_embedder
+    if _default_embedder is None:
+        model_name = os.getenv("KRIAR_EMBEDDING_MODEL")
+        if model_name:
+            try:
+                _default_embedder = SentenceTransformerEmbedder(model_name)
+            except Exception:
+                _default_embedder = HashingEmbedder()
+        else:
+            _default_embedder = HashingEmbedder()
+    return _default_embedder
+
+
+def transcript_fingerprint(transcript):
+    """Digest of a transcript's text and timing, so saved vectors are only reused for the same transcript"""
+    digest = hashlib.sha1(transcript.full_text().encode("utf-8"))
+    digest.update(np.asarray(transcript.starts, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def chunk_bounds(transcript, window_seconds=30.0, stride_seconds=15.0):
+    """(first, last) segment ranges of overlapping time windows, last exclusive"""
+    starts = transcript.starts
+    n = len(starts)
+    bounds = []
+    first = 0
+    while first < n:
+        window_end = starts[first] + window_seconds
+        last = first
+        while last < n and starts[last] < window_end:
+            last += 1
+        bounds.append((first, max(last, first + 1)))
+        if last >= n:
+            break
+        next_start = starts[first] + stride_seconds
+        step = first
+        while step < n and starts[step] < next_start:
+            step += 1
+        first = max(step, first + 1)
+    return np.array(bounds, dtype=np.int64).reshape(-1, 2)
+
+
+class EmbeddingIndex:
+    """Dense vectors for overlapping transcript chunks, searched with one matrix-vector product.
+
+    ``matrix`` is a contiguous float32 array of L2-normalized rows, so cosine
+    similarity is a plain dot product. It can be saved per video ID and reopened
+    memory-mapped.
+    """
+
+    def __init__(self, transcript, embedder, bounds, matrix):
+        self.transcript = transcript
+        self.embedder = embedder
+        self.bounds = bounds
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, transcript, embedder=None, window_seconds=30.0, stride_seconds=15.0):
+        embedder = embedder or get_default_embedder()
+        bounds = chunk_bounds(transcript, window_seconds, stride_seconds)
+        texts = [transcript.join(range(first, last), " ") for first, last in bounds]
+        matrix = embedder.embed(texts) if texts else np.zeros((0, 1), dtype=np.float32)
+        return cls(transcript, embedder, bounds, np.ascontiguousarray(matrix))
+
+    @staticmethod
+    def cache_paths(directory, video_id, embedder):
+        stem = os.path.join(directory, f"{video_id}.{embedder.name}")
+        return stem + ".vectors.npy", stem + ".index.npz"
+
+    @classmethod
+    def load_or_build(cls, transcript, video_id, embedder=None, directory=None, max_bytes=None):
+        """Reopen the saved index for video_id memory-mapped, or build and save it.
+
+        Saved vectors are reused only for a transcript with the same fingerprint;
+        after a save, the least recently used files go once the directory holds
+        more than ``max_bytes``.
+        """
+        embedder = embedder or get_default_embedder()
+        directory = directory or os.getenv("KRIAR_EMBEDDING_DIR", DEFAULT_EMBEDDING_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.getenv("KRIAR_EMBEDDING_MAX_BYTES", DEFAULT_EMBEDDING_MAX_BYTES))
+        vectors_path, index_path = cls.cache_paths(directory, video_id, embedder)
+        fingerprint = transcript_fingerprint(transcript)
+        try:
+            with np.load(index_path) as saved:
+                bounds, saved_fingerprint = saved["bounds"], str(saved["fingerprint"])
+            if saved_fingerprint == fingerprint:
+                matrix = np.load(vectors_path, mmap_mode="r")
+                if len(bounds) == len(matrix):
+                    # Mark as recently used for prune_cache
+                    os.utime(vectors_path)
+                    return cls(transcript, embedder, bounds, matrix)
+        except (OSError, ValueError, KeyError):
+            pass
+        index = cls.build(transcript, embedder)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            np.save(vectors_path, index.matrix)
+            np.savez(index_path, bounds=index.bounds, fingerprint=np.array(fingerprint))
+            cls.prune_cache(directory, max_bytes)
+        except OSError:
+            pass
+        return index
+
+    @staticmethod
+    def delete(video_id, directory=None):
+        """Remove every saved index of a video, whatever embedder built it"""
+        directory = directory or os.getenv("KRIAR_EMBEDDING_DIR", DEFAULT_EMBEDDING_DIR)
+        for path in glob.glob(os.path.join(glob.escape(directory), f"{glob.escape(video_id)}.*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def prune_cache(directory, max_bytes):
+        """Delete the least recently used saved indexes until the directory is within max_bytes"""
+        saved = []
+        for vectors_path in glob.glob(os.path.join(glob.escape(directory), "*.vectors.npy")):
+            index_path = vectors_path[:-len(".vectors.npy")] + ".index.npz"
+            try:
+                size = os.path.getsize(vectors_path) + (os.path.getsize(index_path) if os.path.exists(index_path) else 0)
+                saved.append((os.path.getmtime(vectors_path), size, vectors_path, index_path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _, _ in saved)
+        # The newest entry, just saved, is always kept
+        for _, size, vectors_path, index_path in sorted(saved)[:-1]:
+            if total <= max_bytes:
+                break
+            for path in (vectors_path, index_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def search(self, query, top_k=5):
+        """Top chunks for query as dicts with segment range, times and cosine score"""
+        if not len(self) or not query or top_k <= 0:
+            return []
+        q = self.embedder.embed([query])[0]
+        scores = self.matrix @ q
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            if scores[i] <= 0:
+                break
+            first, last = int(self.bounds[i][0]), int(self.bounds[i][1])
+            results.append({
+                'first_segment': first,
+                'last_segment': last,
+                'start': self.transcript.starts[first],
+                'end': self.transcript.starts[last - 1] + self.transcript.durations[last - 1],
+                'score': float(scores[i]),
+            })
+        return results
+
+    def memory_usage(self):
+        """Bytes held in memory by the vectors (zero when memory-mapped)"""
+        if isinstance(self.matrix, np.memmap):
+            return self.bounds.nbytes
+        return self.matrix.nbytes + self.bounds.nbytes
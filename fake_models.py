@@ -0,0 +1,115 @@
+"""Deterministic stand-ins for the chat model, shared by test.py and benchmark.py.
+
+Nothing here talks to a model provider: answers are drawn from a fixed
+vocabulary seeded by the prompt, after a configurable latency.
+"""
+import asyncio
+import random
+import time
+import zlib
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agent import KriarLearningAgent, message_text
+from response_cache import ResponseCache
+
+VOCABULARY = [
+    "gradient", "descent", "matrix", "vector", "tensor", "loss", "function", "network", "layer", "neuron",
+    "activation", "softmax", "entropy", "probability", "distribution", "sample", "batch", "epoch", "learning",
+    "rate", "optimizer", "momentum", "regularization", "dropout", "convolution", "kernel", "stride", "pooling",
+    "attention", "transformer", "embedding", "token", "sequence", "recurrent", "memory", "cell", "state",
+    "derivative", "chain", "rule", "backpropagation", "weight", "bias", "initialization", "variance", "mean",
+    "python", "numpy", "array", "index", "loop", "class", "object", "method", "variable", "compile",
+]
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model: waits ``latency`` seconds, then emits ``answer_tokens`` tokens at ``token_rate`` per second.
+
+    Being a real BaseChatModel, it streams through LangChain callbacks, so
+    LangGraph's "messages" stream mode sees its tokens like a provider's.
+    """
+
+    latency: float = 0.2
+    token_rate: float = 0.0
+    answer_tokens: int = 40
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def answer(self, messages):
+        """Same reply for the same prompt"""
+        seed = zlib.crc32("".join(message_text(m) for m in messages).encode("utf-8"))
+        rng = random.Random(seed)
+        return [rng.choice(VOCABULARY) + " " for _ in range(self.answer_tokens)]
+
+    def token_delay(self):
+        return 1.0 / self.token_rate if self.token_rate else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        tokens = self.answer(messages)
+        time.sleep(self.latency + self.token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        tokens = self.answer(messages)
+        await asyncio.sleep(self.latency + self.token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        for token in self.answer(messages):
+            time.sleep(self.token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for token in self.answer(messages):
+            await asyncio.sleep(self.token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeModel:
+    """Drop-in for model.Model backed by FakeChatModel"""
+
+    def __init__(self, latency=0.2, token_rate=0.0, answer_tokens=40):
+        self.model_provider = "fake"
+        self.model_name = "fake"
+        self.chat = FakeChatModel(latency=latency, token_rate=token_rate, answer_tokens=answer_tokens)
+
+    def create_model(self):
+        return self.chat
+
+    def bind_tools(self, tools):
+        return self.chat
+
+    def invoke(self, messages):
+        return self.chat.invoke(messages)
+
+    async def ainvoke(self, messages):
+        return await self.chat.ainvoke(messages)
+
+
+def fake_agent(latency, token_rate=0.0, extractors=None):
+    """Agent wired to a FakeModel with caching disabled so every question hits the model"""
+    agent = KriarLearningAgent(optimizer_mode="always", response_cache=ResponseCache(maxsize=0), extractors=extractors,
+                               chapter_summaries=False)
+    agent.model = FakeModel(latency, token_rate)
+    return agent
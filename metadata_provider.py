@@ -0,0 +1,146 @@
+import os
+import threading
+
+import requests
+from yt_dlp import YoutubeDL
+
+from telemetry import annotate
+from ttl_cache import TTLCache
+from transcript_index import format_timestamp
+
+UNKNOWN_METADATA = {"title": "Unknown", "author": "Unknown", "description": "", "length": "Unknown"}
+# Partial results (e.g. oEmbed's title and channel only) are held this long, so a later load retries yt-dlp
+PARTIAL_METADATA_TTL = 10 * 60.0
+
+
+def metadata_from_info(info):
+    """The metadata fields the app uses, from a yt-dlp info dict"""
+    duration = info.get("duration")
+    return {
+        "title": info.get("title"),
+        "author": info.get("uploader") or info.get("channel"),
+        "description": str(info.get("description", "") or "").strip(),
+        "views": info.get("view_count"),
+        "length": format_timestamp(duration) if duration else "Unknown",
+        "chapters": [
+            {"title": c.get("title", ""), "start": c.get("start_time", 0.0), "end": c.get("end_time")}
+            for c in (info.get("chapters") or [])
+        ],
+    }
+
+
+class YtDlpMetadataProvider:
+    """Full yt-dlp extract_info, resolving every format; the slow but complete fallback"""
+
+    name = "ytdlp"
+    complete = True
+
+    def __init__(self, opts=None):
+        self.opts = {"quiet": True, "no_warnings": True, **(opts or {})}
+
+    def fetch(self, url):
+        with YoutubeDL(self.opts) as ydl:
+            return metadata_from_info(ydl.extract_info(url, download=False))
+
+
+class YtDlpFastMetadataProvider(YtDlpMetadataProvider):
+    """yt-dlp restricted to the watch page: no format processing, DASH/HLS manifests or playlists"""
+
+    name = "ytdlp_fast"
+
+    def __init__(self, opts=None):
+        super().__init__({
+            "skip_download": True,
+            "noplaylist": True,
+            "check_formats": False,
+            "extractor_args": {"youtube": {"skip": ["dash", "hls", "translated_subs"]}},
+            **(opts or {}),
+        })
+
+    def fetch(self, url):
+        with YoutubeDL(self.opts) as ydl:
+            return metadata_from_info(ydl.extract_info(url, download=False, process=False))
+
+
+class OEmbedMetadataProvider:
+    """YouTube's oEmbed endpoint: one small JSON request, but only title and channel"""
+
+    name = "oembed"
+    complete = False
+
+    def __init__(self, endpoint="https://www.youtube.com/oembed", timeout=5.0, session=None):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def fetch(self, url):
+        response = self.session.get(self.endpoint, params={"url": url, "format": "json"}, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        return {
+            "title": data.get("title"),
+            "author": data.get("author_name"),
+            "description": "",
+            "views": None,
+            "length": "Unknown",
+            "chapters": [],
+        }
+
+
+PROVIDERS = {
+    provider.name: provider
+    for provider in (YtDlpFastMetadataProvider, OEmbedMetadataProvider, YtDlpMetadataProvider)
+}
+
+
+class MetadataService:
+    """Tries metadata providers in order, caching the first usable result per video ID.
+
+    Only complete results go to the transcript cache; a partial one from a
+    fallback provider is kept in memory for ``PARTIAL_METADATA_TTL`` seconds.
+    """
+
+    def __init__(self, providers=None, cache=None):
+        if providers is None:
+            names = os.getenv("KRIAR_METADATA_PROVIDERS", "ytdlp_fast,oembed,ytdlp").split(",")
+            providers = [PROVIDERS[name.strip()]() for name in names if name.strip() in PROVIDERS]
+        self.providers = providers
+        self.cache = cache
+        self.partial = TTLCache(maxsize=256, ttl=PARTIAL_METADATA_TTL)
+        self.served_by = {}
+
+    def get(self, url, video_id):
+        """Metadata for the video, from the cache or the first provider that succeeds"""
+        cached = self.cache.get("metadata", video_id) if self.cache is not None else None
+        if cached is None:
+            cached = self.partial.get(video_id)
+        annotate(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+        for provider in self.providers:
+            try:
+                metadata = provider.fetch(url)
+            except Exception:
+                continue
+            if metadata.get("title"):
+                self.served_by[provider.name] = self.served_by.get(provider.name, 0) + 1
+                annotate(provider=provider.name)
+                if not provider.complete:
+                    self.partial.set(video_id, metadata)
+                elif self.cache is not None:
+                    self.cache.set("metadata", video_id, metadata)
+                return metadata
+        return dict(UNKNOWN_METADATA)
+
+
+_default_services = {}
+_default_services_lock = threading.Lock()
+
+
+def get_metadata_service(cache):
+    """Shared MetadataService for a transcript cache"""
+    with _default_services_lock:
+        service = _default_services.get(id(cache))
+        if service is None:
+            service = _default_services[id(cache)] = MetadataService(cache=cache)
+        return service
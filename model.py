@@ -1,9 +1,52 @@
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
-import os
+import hashlib
+import threading
+import httpx
 from langchain_google_genai import ChatGoogleGenerativeAI
+
+# Chat clients are shared across Model instances and sessions; they are stateless
+# between calls and keep their HTTP connections alive for reuse.
+_client_pool = {}
+_bound_pool = {}
+_pool_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+
+
+def get_http_client():
+    """Process-wide keep-alive HTTP client used by the OpenAI and Groq chat clients' sync calls"""
+    global _http_client
+    with _pool_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _http_client
+
+
+def get_async_http_client():
+    """Process-wide keep-alive HTTP client used by the OpenAI and Groq chat clients' async calls"""
+    global _async_http_client
+    with _pool_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _async_http_client
+
+
+def clear_client_pool():
+    """Drop every pooled chat client, e.g. after rotating API keys"""
+    with _pool_lock:
+        _client_pool.clear()
+        _bound_pool.clear()
+
+
 class Model:
-    def __init__(self, model_provider, model_name, api_key, temperature=0.7, max_tokens=2000, verbose=True):
+    def __init__(self, model_provider, model_name, api_key=None, temperature=0.7, max_tokens=2000, verbose=True):
         self.model_provider = model_provider
         self.model_name = model_name
         self.api_key = api_key
@@ -11,38 +54,75 @@ class Model:
         self.max_tokens = max_tokens
         self.verbose = verbose
 
-    def create_model(self):
+    def pool_key(self):
+        """Identity of the chat client this model config maps to"""
+        key_hash = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:16] if self.api_key else None
+        return (self.model_provider, self.model_name, self.temperature, self.max_tokens, self.verbose, key_hash)
+
+    def build_model(self):
+        """Construct a new chat client; the API key is passed directly rather than via os.environ"""
         if self.model_provider == "openai":
-            os.environ["OPENAI_API_KEY"] = self.api_key
+            kwargs = {"api_key": self.api_key} if self.api_key else {}
             return ChatOpenAI(
                 model=self.model_name,
                 temperature=self.temperature,
-                verbose=self.verbose
+                max_tokens=self.max_tokens,
+                verbose=self.verbose,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
+                **kwargs
             )
         elif self.model_provider == "groq":
-            os.environ["GROQ_API_KEY"] = self.api_key
+            kwargs = {"api_key": self.api_key} if self.api_key else {}
             return ChatGroq(
-                
                 model=self.model_name,
-                temperature=self.temperature, 
-                verbose=self.verbose
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                verbose=self.verbose,
+                http_client=get_http_client(),
+                http_async_client=get_async_http_client(),
+                **kwargs
             )
         elif self.model_provider == "google":
-            os.environ["GOOGLE_API_KEY"] = self.api_key
+            kwargs = {"google_api_key": self.api_key} if self.api_key else {}
             return ChatGoogleGenerativeAI(
                 model=self.model_name,
                 temperature=self.temperature,
-                verbose=self.verbose
+                max_output_tokens=self.max_tokens,
+                verbose=self.verbose,
+                **kwargs
             )
         else:
             raise ValueError(f"Invalid model provider: {self.model_provider}")
 
+    def create_model(self):
+        """Return the pooled chat client for this config, creating it on first use"""
+        key = self.pool_key()
+        with _pool_lock:
+            model = _client_pool.get(key)
+        if model is None:
+            model = self.build_model()
+            with _pool_lock:
+                model = _client_pool.setdefault(key, model)
+        return model
+
     def bind_tools(self, tools):
-        """Bind tools to the model"""
-        model = self.create_model()
-        return model.bind_tools(tools)
+        """Bind tools to the model, reusing the bound runnable for the same tool set"""
+        key = (self.pool_key(), tuple(getattr(tool, "name", repr(tool)) for tool in tools))
+        with _pool_lock:
+            bound = _bound_pool.get(key)
+        if bound is None:
+            bound = self.create_model().bind_tools(tools)
+            with _pool_lock:
+                bound = _bound_pool.setdefault(key, bound)
+        return bound
 
     def invoke(self, messages):
         """Invoke the model with messages"""
         model = self.create_model()
         return model.invoke(messages)
+
+    async def ainvoke(self, messages):
+        """Invoke the model with messages without blocking the event loop"""
+        model = self.create_model()
+        return await model.ainvoke(messages)
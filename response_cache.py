@@ -0,0 +1,123 @@
+import re
+import threading
+
+from ttl_cache import TTLCache
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "in", "on", "at", "for",
+    "and", "or", "can", "could", "would", "please", "me", "i", "you", "tell", "about", "here", "s",
+}
+# Kept as terms: "why does X" and "how does X" ask different things
+QUESTION_WORDS = frozenset({"what", "why", "how", "when", "where", "which", "who", "explain"})
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase the query and collapse it to its words"""
+    return " ".join(re.findall(r"[a-z0-9']+", (query or "").lower()))
+
+
+def query_terms(normalized: str) -> frozenset:
+    """Content words of a normalized query, used for near-duplicate matching"""
+    terms = frozenset(word for word in normalized.split() if word not in STOPWORDS)
+    return terms or frozenset(normalized.split())
+
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two term sets"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class ResponseCache:
+    """Answers keyed by (scope, selected transcript segments, normalized query).
+
+    ``scope`` is whatever must match exactly, e.g. (provider, model, video ID).
+    Queries within the same scope and segment window match if they use the same
+    question words and their content-word Jaccard similarity is at least ``threshold``.
+    """
+
+    def __init__(self, maxsize=4096, ttl=6 * 3600.0, threshold=0.8):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope, segments, query):
+        """Return a cached answer for a matching query, or None"""
+        window = (scope, frozenset(segments))
+        normalized = normalize_query(query)
+        response = self._entries.get((window, normalized))
+        if response is None:
+            response = self._similar(window, query_terms(normalized))
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return response
+
+    def _similar(self, window, terms):
+        with self._lock:
+            candidates = list(self._buckets.get(window, {}).items())
+        best, best_score = None, self.threshold
+        question = terms & QUESTION_WORDS
+        for normalized, candidate_terms in candidates:
+            if candidate_terms & QUESTION_WORDS != question:
+                continue
+            score = similarity(terms, candidate_terms)
+            if score >= best_score:
+                response = self._entries.get((window, normalized))
+                if response is None:
+                    self._discard(window, normalized)
+                    continue
+                best, best_score = response, score
+        return best
+
+    def _discard(self, window, normalized):
+        with self._lock:
+            bucket = self._buckets.get(window)
+            if bucket is not None:
+                bucket.pop(normalized, None)
+                if not bucket:
+                    del self._buckets[window]
+
+    def set(self, scope, segments, query, response):
+        """Store an answer for this scope, segment window and query"""
+        window = (scope, frozenset(segments))
+        normalized = normalize_query(query)
+        self._entries.set((window, normalized), response)
+        with self._lock:
+            self._buckets.setdefault(window, {})[normalized] = query_terms(normalized)
+            # Drop bucket entries the LRU has already evicted once buckets outgrow it
+            if sum(len(b) for b in self._buckets.values()) > 2 * self._entries.maxsize:
+                live = {key for key, _ in self._entries.items()}
+                for w in list(self._buckets):
+                    self._buckets[w] = {n: t for n, t in self._buckets[w].items() if (w, n) in live}
+                    if not self._buckets[w]:
+                        del self._buckets[w]
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        """Lookup hit rate"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+
+_default_response_cache = ResponseCache()
+
+
+def get_default_response_cache():
+    """Process-wide response cache shared by every agent"""
+    return _default_response_cache
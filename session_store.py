@@ -0,0 +1,169 @@
+import abc
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+DEFAULT_SESSION_PATH = os.path.join(os.path.expanduser("~"), ".cache", "kriar", "sessions.sqlite3")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot store {type(value).__name__} in a session record")
+
+
+class SessionStore(abc.ABC):
+    """Persistent, append-only store of per-session records.
+
+    Records are JSON-serializable dicts (datetimes are stored as ISO strings)
+    grouped by session ID and kind, e.g. "chat", "code" or "video". Records are
+    never updated in place; readers take the full list or the latest one.
+    """
+
+    @abc.abstractmethod
+    def append(self, session_id, kind, record):
+        """Store a record of a kind for a session"""
+
+    @abc.abstractmethod
+    def records(self, session_id, kind):
+        """All records of a kind for a session, oldest first"""
+
+    def latest(self, session_id, kind):
+        """Most recent record of a kind for a session, or None"""
+        records = self.records(session_id, kind)
+        return records[-1] if records else None
+
+    def checkpointer(self):
+        """LangGraph checkpointer that persists agent state alongside these records"""
+        from langgraph.checkpoint.memory import InMemorySaver
+
+        return InMemorySaver()
+
+
+class SqliteSessionStore(SessionStore):
+    """SessionStore on a local SQLite file, shared with the LangGraph checkpoint tables"""
+
+    def __init__(self, path=DEFAULT_SESSION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpointer = None
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_session ON records (session_id, kind, id)")
+        self._conn.commit()
+
+    def append(self, session_id, kind, record):
+        payload = json.dumps(record, default=_encode, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO records (session_id, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, kind, payload, time.time()),
+            )
+            self._conn.commit()
+
+    def records(self, session_id, kind):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM records WHERE session_id = ? AND kind = ? ORDER BY id",
+                (session_id, kind),
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def latest(self, session_id, kind):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM records WHERE session_id = ? AND kind = ? ORDER BY id DESC LIMIT 1",
+                (session_id, kind),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def sessions(self):
+        """(session_id, last_updated) pairs, most recently updated first"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT session_id, MAX(created_at) AS updated FROM records GROUP BY session_id ORDER BY updated DESC"
+            ).fetchall()
+
+    def checkpointer(self):
+        """SqliteSaver on this file when langgraph-checkpoint-sqlite is installed, else in-memory"""
+        if self._checkpointer is None:
+            try:
+                self._checkpointer = _sqlite_saver(self.path)
+            except ImportError:
+                self._checkpointer = super().checkpointer()
+        return self._checkpointer
+
+
+def _sqlite_saver(path):
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        """SqliteSaver whose async methods run the sync ones in a worker thread, so ainvoke can share it.
+
+        Only the newest checkpoint of each thread is kept: every put deletes the
+        older rows and their pending writes, so the file does not grow per turn.
+        """
+
+        def put(self, config, checkpoint, metadata, new_versions):
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            self.prune(saved)
+            return saved
+
+        def prune(self, config):
+            """Delete the checkpoints and writes older than the one config points at"""
+            configurable = config["configurable"]
+            key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+            with self.cursor() as cur:
+                for table in ("checkpoints", "writes"):
+                    cur.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    return ThreadedSqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_session_store():
+    """Process-wide session store configured from the environment"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SqliteSessionStore(os.getenv("KRIAR_SESSION_PATH", DEFAULT_SESSION_PATH))
+        return _default_store
@@ -0,0 +1,216 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds for the span duration histograms
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_request = contextvars.ContextVar("kriar_request", default=None)
+_current_span = contextvars.ContextVar("kriar_span", default=None)
+
+
+def current_request_id():
+    """ID of the request being traced in this context, if any"""
+    trace = _current_request.get()
+    return trace.request_id if trace is not None else None
+
+
+def annotate(**attributes):
+    """Add attributes (tokens, cache hits, ...) to the innermost open span"""
+    span = _current_span.get()
+    if span is not None:
+        span.update(attributes)
+
+
+class RequestTrace:
+    """Spans and counters for one question, from context lookup to the final answer"""
+
+    def __init__(self, **attributes):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self):
+        """Wall time per span name plus token, cache and tool-loop totals"""
+        totals = {"span_seconds": {}, "tokens_in": 0, "tokens_out": 0, "cache_hits": 0, "cache_misses": 0, "tool_loops": 0}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            totals["span_seconds"][span["name"]] = totals["span_seconds"].get(span["name"], 0.0) + span["seconds"]
+            totals["tokens_in"] += span.get("tokens_in", 0)
+            totals["tokens_out"] += span.get("tokens_out", 0)
+            if "cache_hit" in span:
+                totals["cache_hits" if span["cache_hit"] else "cache_misses"] += 1
+            if span["name"] == "tool_caller_node":
+                totals["tool_loops"] += 1
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "seconds": self.duration,
+            **self.attributes,
+            **self.totals(),
+            "spans": spans,
+        }
+
+
+class Telemetry:
+    """Structured spans with Prometheus-style aggregates and an optional JSON-lines trace log.
+
+    ``span`` times a block and records its attributes (tokens, cache hits, ...)
+    on the current request, if any, and in process-wide histograms and counters.
+    ``request`` opens a trace for one question; finished traces are kept for the
+    debug panel and appended to ``trace_path`` when one is configured.
+    """
+
+    def __init__(self, trace_path=None, keep_requests=50):
+        self.trace_path = trace_path
+        self.recent = deque(maxlen=keep_requests)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def request(self, **attributes):
+        trace = RequestTrace(**attributes)
+        token = _current_request.set(trace)
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            try:
+                _current_request.reset(token)
+            except ValueError:
+                # A streaming generator can be closed from a different context than it started in
+                _current_request.set(None)
+            trace.duration = time.perf_counter() - started
+            self.finish(trace)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block; the yielded dict can be updated with attributes before it closes"""
+        attributes = dict(attributes)
+        token = _current_span.set(attributes)
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                _current_span.set(None)
+            self.record(name, seconds, **attributes)
+
+    def record(self, name, seconds, **attributes):
+        """Record an already timed span"""
+        span = {"name": name, "seconds": seconds, **attributes}
+        trace = _current_request.get()
+        if trace is not None:
+            trace.add(span)
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {"count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)})
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            for direction in ("in", "out"):
+                tokens = attributes.get(f"tokens_{direction}")
+                if tokens:
+                    self._increment("kriar_tokens_total", tokens, span=name, direction=direction)
+            if "cache_hit" in attributes:
+                self._increment("kriar_cache_lookups_total", 1, span=name,
+                                result="hit" if attributes["cache_hit"] else "miss")
+            if "error" in attributes:
+                self._increment("kriar_span_errors_total", 1, span=name)
+
+    def _increment(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def finish(self, trace):
+        totals = trace.totals()
+        with self._lock:
+            self._increment("kriar_requests_total", 1)
+            self._increment("kriar_tool_loops_total", totals["tool_loops"])
+            self.recent.append(trace)
+        logger.debug("request %s took %.3fs: %s", trace.request_id, trace.duration, totals["span_seconds"])
+        if self.trace_path:
+            try:
+                with open(self.trace_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), default=str) + "\n")
+            except OSError as e:
+                logger.warning("Could not write trace to %s: %s", self.trace_path, e)
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = ["# TYPE kriar_span_seconds histogram"]
+        with self._lock:
+            histograms = {name: dict(h, buckets=list(h["buckets"])) for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+        for name, histogram in sorted(histograms.items()):
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f'kriar_span_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'kriar_span_seconds_bucket{{span="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'kriar_span_seconds_sum{{span="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'kriar_span_seconds_count{{span="{name}"}} {histogram["count"]}')
+        typed = set()
+        for (metric, labels), value in sorted(counters.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def recent_traces(self, request_ids=None):
+        """Finished traces, oldest first, limited to request_ids when given"""
+        with self._lock:
+            traces = list(self.recent)
+        return traces if request_ids is None else [trace for trace in traces if trace.request_id in request_ids]
+
+    def recent_jsonl(self):
+        """Recent request traces as JSON lines"""
+        return "".join(json.dumps(trace.to_dict(), default=str) + "\n" for trace in self.recent_traces())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.recent.clear()
+
+
+_default_telemetry = None
+_default_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Process-wide telemetry; KRIAR_TRACE_PATH enables the JSON-lines trace log"""
+    global _default_telemetry
+    with _default_telemetry_lock:
+        if _default_telemetry is None:
+            _default_telemetry = Telemetry(trace_path=os.getenv("KRIAR_TRACE_PATH"))
+        return _default_telemetry
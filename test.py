@@ -1 +1,630 @@
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
 
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import tool
+
+from bm25_index import BM25Index, tokenize
+from chapter_summaries import build_chapter_summaries, model_chapter_summarizer, segment_chapters
+from context_assembler import RELATED_HEADER, ContextAssembler, count_tokens
+from context_extractor import ContextExtractor, ContextExtractorRegistry
+from embedding_index import EmbeddingIndex, HashingEmbedder
+from fake_models import FakeChatModel, fake_agent
+from conversation_memory import ConversationMemory
+from metadata_provider import MetadataService
+from model import Model, get_async_http_client
+from response_cache import ResponseCache
+from session_store import SqliteSessionStore
+from telemetry import Telemetry, annotate
+from tool_runner import ToolRunner
+from transcript_cache import TranscriptCache
+from transcript_index import CompactTranscript, TranscriptIndex
+from wikipedia_client import OfflineWikipedia, WikipediaClient
+
+
+def reference_extract_context(snippets, target_timestamp, num_segments=20, context_window=10.0):
+    """The original list-sorting selection from ContextExtractor.extract_context"""
+    all_segments = []
+    for snippet in snippets:
+        all_segments.append({
+            'text': snippet.text,
+            'start': snippet.start,
+            'duration': snippet.duration,
+            'end': snippet.start + snippet.duration,
+            'distance_from_target': abs(snippet.start - target_timestamp)
+        })
+    all_segments.sort(key=lambda x: x['start'])
+
+    relevant_segments = []
+    for segment in all_segments:
+        segment_center = segment['start'] + (segment['duration'] / 2)
+        if abs(segment_center - target_timestamp) <= context_window:
+            relevant_segments.append(segment)
+
+    if not relevant_segments:
+        all_segments.sort(key=lambda x: x['distance_from_target'])
+        relevant_segments = all_segments[:num_segments * 2]
+
+    relevant_segments.sort(key=lambda x: (x['distance_from_target'], x['start']))
+    selected_segments = relevant_segments[:num_segments]
+    selected_segments.sort(key=lambda x: x['start'])
+    return selected_segments
+
+
+def make_snippets(rng, count, gap=False):
+    snippets = []
+    t = 0.0
+    for i in range(count):
+        duration = rng.choice([0.5, 1.0, 2.5, 4.0, rng.uniform(0.1, 8.0)])
+        snippets.append(SimpleNamespace(text=f"snippet {i} ", start=round(t, 2), duration=duration))
+        t += rng.choice([0.0, 1.0, duration, rng.uniform(0.0, 5.0)])
+        if gap and i == count // 2:
+            t += 600.0
+    rng.shuffle(snippets)
+    return snippets
+
+
+def test_index_matches_reference_selection():
+    rng = random.Random(1234)
+    for trial in range(50):
+        snippets = make_snippets(rng, rng.randint(1, 400), gap=trial % 2 == 0)
+        index = TranscriptIndex.from_snippets(snippets)
+        end = max(s.start + s.duration for s in snippets)
+        targets = [0, end, end + 100, -5] + [rng.uniform(0, end) for _ in range(20)]
+        targets += [s.start for s in rng.sample(snippets, min(5, len(snippets)))]
+        for target in targets:
+            for num_segments, context_window in [(20, 10.0), (3, 2.0), (5, 0.0), (1, 30.0)]:
+                expected = reference_extract_context(snippets, target, num_segments, context_window)
+                actual = [index.segment(i, target)
+                          for i in index.select(target, num_segments, context_window)]
+                assert actual == expected, (trial, target, num_segments, context_window)
+
+
+def test_empty_index_selects_nothing():
+    index = TranscriptIndex(CompactTranscript([], [], []))
+    assert index.select(10.0, 20, 10.0) == []
+
+
+def test_compact_transcript_round_trips_rows():
+    rows = [["b", 2.0, 1.0], ["a", 0.0, 2.0], ["", 3.0, 0.5], ["héllo", 5.0, 1.5]]
+    transcript = CompactTranscript.from_rows(rows)
+    assert transcript.to_rows() == sorted(rows, key=lambda r: r[1])
+    assert transcript.full_text() == "a b  héllo"
+    assert transcript.join([0, 3]) == "ahéllo"
+    assert transcript.memory_usage() > 0
+
+
+def test_bm25_ranks_exact_term_passages_first():
+    texts = ["we start with linear algebra", "vectors and matrices", "um so like you know",
+             "backpropagation computes the gradient", "of the loss with respect to", "each weight in the network"]
+    texts += [f"filler about optimisers part {i}" for i in range(12)]
+    lecture = CompactTranscript([i * 5.0 for i in range(len(texts))], [5.0] * len(texts), texts)
+    index = BM25Index(lecture, passage_size=3)
+    assert tokenize("Um, so what IS the gradient?") == ["gradient"]
+    hits = index.search("How does backpropagation use the gradient?", top_k=3)
+    assert (hits[0]["first_segment"], hits[0]["last_segment"]) == (3, 6)
+    assert all(hit["score"] < hits[0]["score"] for hit in hits[1:])
+    assert index.search("what is it about", top_k=3) == []
+    assert index.search("", top_k=3) == []
+    assert BM25Index(CompactTranscript([], [], [])).search("gradient") == []
+
+
+def test_conversation_memory_stays_under_budget():
+    memory = ConversationMemory(token_budget=300, window_turns=3)
+    for i in range(40):
+        answer = " ".join(f"Point {i}.{j} explains the gradient of layer {j}." for j in range(15))
+        memory.add_turn(f"What does step {i} of the derivation show?", answer)
+        assert memory.tokens() <= memory.token_budget + 10
+    memory.wait()
+    assert len(memory) <= 3
+    assert memory.compressions > 0
+    assert "step 39" in memory.render()
+    assert "step 38" in memory.summary_text()
+
+
+def test_pooled_chat_clients_honour_max_tokens_and_share_http_clients():
+    short = Model("openai", "gpt-4o-mini", api_key="sk-test", max_tokens=256)
+    long = Model("openai", "gpt-4o-mini", api_key="sk-test", max_tokens=4096)
+    assert short.create_model() is Model("openai", "gpt-4o-mini", api_key="sk-test", max_tokens=256).create_model()
+    assert (short.create_model().max_tokens, long.create_model().max_tokens) == (256, 4096)
+    assert long.create_model().root_async_client._client is get_async_http_client()
+
+
+def test_session_store_appends_and_restores_records(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    store.append("s1", "chat", {"role": "user", "content": "first", "timestamp": datetime(2024, 1, 1, 12, 0)})
+    store.append("s1", "chat", {"role": "assistant", "content": "second", "timestamp": datetime(2024, 1, 1, 12, 1)})
+    store.append("s2", "chat", {"role": "user", "content": "other session", "timestamp": datetime(2024, 1, 2)})
+    reopened = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    assert [r["content"] for r in reopened.records("s1", "chat")] == ["first", "second"]
+    assert reopened.latest("s1", "chat")["timestamp"] == "2024-01-01T12:01:00"
+    assert reopened.latest("s1", "video") is None
+
+
+def test_agent_resumes_conversation_memory_from_the_checkpoint(tmp_path):
+    def agent_on(store):
+        agent = fake_agent(0.0)
+        agent.checkpointer, agent.session_id = store.checkpointer(), "s1"
+        return agent
+
+    agent = agent_on(SqliteSessionStore(str(tmp_path / "sessions.sqlite3")))
+    agent.execute_task("What is a tensor?")
+    asyncio.run(agent.execute_task_async("What is a matrix?"))
+    resumed = agent_on(SqliteSessionStore(str(tmp_path / "sessions.sqlite3")))
+    assert resumed.resume_memory("other video") is None
+    assert resumed.resume_memory("").render() == agent.memory_for("").render()
+    assert len(resumed.memory_for("")) == 2
+    agent.execute_task("What is a vector?")
+    with sqlite3.connect(str(tmp_path / "sessions.sqlite3")) as conn:
+        rows = conn.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id").fetchall()
+    assert rows and all(count == 1 for _, count in rows)
+
+
+def test_wikipedia_client_serves_offline_index_and_caches(tmp_path):
+    offline = OfflineWikipedia.build(str(tmp_path / "wiki.sqlite3"), [
+        ("Gradient descent", "Gradient descent is a first-order iterative optimization algorithm."),
+        ("Backpropagation", "Backpropagation computes the gradient of a loss function for a neural network."),
+        ("Python (programming language)", "Python is a high-level programming language."),
+    ])
+    client = WikipediaClient(offline=offline)
+    result = client.run("gradient descent")
+    assert result.startswith("Page: Gradient descent\nSummary: Gradient descent is")
+    assert client.run("  Gradient Descent? ") == result
+    assert client.stats()["hits"] == 1
+    assert client.offline_hits == 1 and client.api_calls == 0
+    assert offline.search("gradient boosting") == []
+    assert offline.search("neural network gradient") == [offline.search("Backpropagation")[0]]
+
+
+def test_telemetry_traces_spans_per_request(tmp_path):
+    telemetry = Telemetry(trace_path=str(tmp_path / "traces.jsonl"))
+    with telemetry.request(question="what is this?") as trace:
+        with telemetry.span("optimizer_node"):
+            annotate(cache_hit=False, tokens_in=120, tokens_out=30)
+        with telemetry.span("tool_caller_node"):
+            with telemetry.span("wikipedia", cache_hit=True):
+                pass
+    totals = trace.totals()
+    assert set(totals["span_seconds"]) == {"optimizer_node", "tool_caller_node", "wikipedia"}
+    assert (totals["tokens_in"], totals["tokens_out"]) == (120, 30)
+    assert (totals["cache_hits"], totals["cache_misses"], totals["tool_loops"]) == (1, 1, 1)
+    metrics = telemetry.prometheus_text()
+    assert 'kriar_span_seconds_count{span="optimizer_node"} 1' in metrics
+    assert 'kriar_tokens_total{direction="in",span="optimizer_node"} 120' in metrics
+    assert (tmp_path / "traces.jsonl").read_text() == telemetry.recent_jsonl()
+    with telemetry.request(question="someone else's") as other:
+        pass
+    assert telemetry.recent_traces({trace.request_id}) == [trace]
+    assert telemetry.recent_traces() == [trace, other]
+
+
+def test_tool_runner_runs_calls_concurrently_with_timeouts():
+    # Each lookup waits for the other two, so they only finish if all three run at once
+    together, release = threading.Barrier(3), threading.Event()
+
+    @tool
+    def slow_lookup(query: str) -> str:
+        """Look something up slowly"""
+        together.wait(5)
+        return f"found {query}"
+
+    @tool
+    def stuck_lookup(query: str) -> str:
+        """Never answers in time"""
+        release.wait(5)
+        return "too late"
+
+    runner = ToolRunner([slow_lookup, stuck_lookup], timeout=5.0, timeouts={"stuck_lookup": 0.3})
+    calls = [{"name": "slow_lookup", "args": {"query": q}, "id": f"call_{q}"} for q in ("a", "b", "c")]
+    calls.append({"name": "stuck_lookup", "args": {"query": "d"}, "id": "call_d"})
+    state = {"messages": [AIMessage(content="", tool_calls=calls)]}
+    messages = runner.invoke(state)["messages"]
+    release.set()
+    assert [m.tool_call_id for m in messages] == ["call_a", "call_b", "call_c", "call_d"]
+    assert [m.content for m in messages[:3]] == ["found a", "found b", "found c"]
+    assert messages[3].status == "error" and "timed out" in messages[3].content
+
+
+class LookUpThenAnswerModel(FakeChatModel):
+    """Says it will look something up and calls a tool, then answers once the tool result is in"""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        if any(isinstance(m, ToolMessage) for m in messages):
+            pieces = [AIMessageChunk(content="The answer "), AIMessageChunk(content="is 42.")]
+        else:
+            call = {"name": "lookup", "args": '{"query": "answer"}', "id": "call_1", "index": 0}
+            pieces = [AIMessageChunk(content="Let me look that up. "), AIMessageChunk(content="", tool_call_chunks=[call])]
+        for piece in pieces:
+            chunk = ChatGenerationChunk(message=piece)
+            if run_manager:
+                run_manager.on_llm_new_token(piece.content, chunk=chunk)
+            yield chunk
+
+
+def test_stream_task_answers_with_the_final_executor_pass_only():
+    @tool
+    def lookup(query: str) -> str:
+        """Look something up"""
+        return "42"
+
+    agent = fake_agent(0.0)
+    agent.model.chat = LookUpThenAnswerModel(latency=0.0)
+    agent.tool_runner = ToolRunner([lookup])
+    answer = {}
+
+    def tokens():
+        answer["text"] = yield from agent.stream_task("What is the answer?")
+
+    streamed = list(tokens())
+    assert streamed == ["Let me look that up. ", "The answer ", "is 42."]
+    assert answer["text"] == "The answer is 42."
+    assert agent.memory_for("").render().endswith("Assistant: The answer is 42.")
+    assert agent.request_metrics[-1]["ttft"] is not None
+
+
+class ToolHungryModel:
+    """Model that asks for another tool call whenever it has tools bound"""
+
+    model_provider = model_name = "fake"
+
+    def __init__(self):
+        self.tool_rounds = 0
+        self.final_inputs = None
+
+    def bind_tools(self, tools):
+        model = self
+
+        class Bound:
+            def invoke(self, messages):
+                model.tool_rounds += 1
+                call = {"name": "lookup", "args": {"query": "more"}, "id": f"call_{model.tool_rounds}"}
+                return AIMessage(content="", tool_calls=[call])
+
+        return Bound()
+
+    def invoke(self, messages):
+        self.final_inputs = messages
+        return AIMessage(content="Here is what I found.")
+
+
+def test_tool_loop_stops_after_max_tool_iterations_with_an_unbound_answer():
+    @tool
+    def lookup(query: str) -> str:
+        """Look something up"""
+        return "nothing new"
+
+    agent = fake_agent(0.0)
+    agent.optimizer_mode, agent.max_tool_iterations = "never", 3
+    agent.model = ToolHungryModel()
+    agent.tool_runner = ToolRunner([lookup])
+    assert agent.execute_task("Find everything about gradients") == "Here is what I found."
+    assert agent.model.tool_rounds == 3
+    assert sum(isinstance(m, ToolMessage) for m in agent.model.final_inputs) == 3
+    assert agent.model.final_inputs[-1].content.startswith("No more tool calls are available.")
+
+
+def test_chapter_summaries_use_markers_or_topic_shifts_and_batch_model_calls():
+    topics = ["gradient descent step size", "matrix vector product", "softmax cross entropy"]
+    texts = [f"{topics[int(i * 3.0 // 1200)]} example {i}." for i in range(1200)]
+    transcript = CompactTranscript([i * 3.0 for i in range(1200)], [3.0] * 1200, texts)
+    chapters = segment_chapters(transcript, min_seconds=300, max_seconds=1500)
+    assert [round(c["start"]) for c in chapters] == [0, 1200, 2400]
+    marked = segment_chapters(transcript, [{"title": "Intro", "start": 0.0}, {"title": "Matrices", "start": 1200.0}])
+    assert [(c["title"], c["first_segment"], c["last_segment"]) for c in marked] == [
+        ("Intro", 0, 400), ("Matrices", 400, 1200)]
+
+    prompts = []
+
+    def reply(messages):
+        prompts.append(messages[0].content)
+        count = messages[0].content.count("Chapter ")
+        return SimpleNamespace(content="\n".join(f"{n + 1}. Summary {n + 1}" for n in range(count)))
+
+    summarizer = model_chapter_summarizer(SimpleNamespace(invoke=reply), batch_size=4)
+    markers = [{"title": f"Section {n}", "start": n * 600.0} for n in range(5)]
+    summarized, complete = build_chapter_summaries(transcript, {"chapters": markers}, summarizer)
+    assert complete and len(prompts) == 2
+    assert [c["summary"] for c in summarized] == ["Summary 1", "Summary 2", "Summary 3", "Summary 4", "Summary 1"]
+    assert summarized[-1]["end"] == 3600.0
+
+
+def test_registry_retries_videos_whose_transcript_fetch_failed(monkeypatch, tmp_path):
+    monkeypatch.setenv("KRIAR_EMBEDDING_DIR", str(tmp_path))
+    snippets = [SimpleNamespace(text=f"snippet {i}", start=i * 3.0, duration=3.0) for i in range(5)]
+    fetches = [[], SimpleNamespace(snippets=snippets, language="English", language_code="en", is_generated=True)]
+
+    class FlakyExtractor(ContextExtractor):
+        def fetch_transcript(self):
+            return fetches.pop(0)
+
+        def load_metadata(self):
+            return {}
+
+    monkeypatch.setattr("context_extractor.ContextExtractor", FlakyExtractor)
+    registry = ContextExtractorRegistry()
+    url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+    cache = TranscriptCache(":memory:")
+    assert not registry.get_or_create(url, cache=cache).transcript
+    assert registry.get("dQw4w9WgXcQ") is None
+    extractor = registry.get_or_create(url, cache=cache)
+    assert len(extractor.transcript) == 5
+    assert registry.get("dQw4w9WgXcQ") is extractor
+    extractor.warm_indexes()
+    loaded = extractor.transcript.memory_usage() + extractor.index.memory_usage()
+    assert extractor.bm25.memory_usage() > 0
+    assert extractor.memory_usage() >= loaded + extractor.bm25.memory_usage() + extractor.embeddings.memory_usage()
+
+
+def test_registry_shares_inflight_loads_and_warms_indexes_on_its_own_pool(monkeypatch):
+    release_load, release_warm_up = threading.Event(), threading.Event()
+    loads = []
+
+    class SlowExtractor(ContextExtractor):
+        def __init__(self, url, **kwargs):
+            loads.append(url)
+            if len(loads) == 1:
+                release_load.wait(5)
+            super().__init__(url, cache=TranscriptCache(":memory:"))
+
+        def fetch_transcript(self):
+            snippets = [SimpleNamespace(text=f"snippet {i}", start=i * 3.0, duration=3.0) for i in range(5)]
+            return SimpleNamespace(snippets=snippets, language="English", language_code="en", is_generated=True)
+
+        def load_metadata(self):
+            return {}
+
+        def warm_indexes(self):
+            release_warm_up.wait(5)
+
+    monkeypatch.setattr("context_extractor.ContextExtractor", SlowExtractor)
+    registry = ContextExtractorRegistry(max_workers=1)
+    first = registry.prefetch("https://www.youtube.com/watch?v=aaaaaaaaaaa")
+    assert registry.prefetch("https://youtu.be/aaaaaaaaaaa") is first
+    release_load.set()
+    assert first.result(5).video_id == "aaaaaaaaaaa"
+    # The first video's warm-up is still blocked, yet the single load worker is free for the next video
+    second = registry.prefetch("https://www.youtube.com/watch?v=bbbbbbbbbbb")
+    assert second.result(5).video_id == "bbbbbbbbbbb"
+    release_warm_up.set()
+    assert len(loads) == 2
+
+
+def test_async_questions_about_different_videos_keep_their_own_context(monkeypatch, tmp_path):
+    monkeypatch.setenv("KRIAR_EMBEDDING_DIR", str(tmp_path))
+    topics = {"aaaaaaaaaaa": "gradient descent", "bbbbbbbbbbb": "dropout layers"}
+
+    class LectureExtractor(ContextExtractor):
+        def __init__(self, url, **kwargs):
+            super().__init__(url, cache=TranscriptCache(":memory:"))
+
+        def fetch_transcript(self):
+            snippets = [SimpleNamespace(text=f"{topics[self.video_id]} part {i}", start=i * 3.0, duration=3.0)
+                        for i in range(5)]
+            return SimpleNamespace(snippets=snippets, language="English", language_code="en", is_generated=True)
+
+        def load_metadata(self):
+            return {}
+
+    monkeypatch.setattr("context_extractor.ContextExtractor", LectureExtractor)
+    agent = fake_agent(0.01, extractors=ContextExtractorRegistry())
+    contexts = {}
+    assemble_context = agent.assemble_context
+
+    def recording_assemble_context(extractor, timestamp, query):
+        assembled = assemble_context(extractor, timestamp, query)
+        contexts[query] = assembled.text
+        return assembled
+
+    agent.assemble_context = recording_assemble_context
+
+    async def ask_both():
+        return await asyncio.gather(*(
+            agent.execute_task_async(f"What is covered in {video_id}?", f"https://www.youtube.com/watch?v={video_id}", 6)
+            for video_id in topics))
+
+    assert all(not answer.startswith("Error") for answer in asyncio.run(ask_both()))
+    for video_id, topic in topics.items():
+        assert topic in contexts[f"What is covered in {video_id}?"]
+        assert len(agent.memory_for(video_id)) == 1
+    assert agent.context_extractor is None
+
+
+def test_embedding_index_reloads_saved_vectors_only_for_the_same_transcript(monkeypatch, tmp_path):
+    monkeypatch.setenv("KRIAR_EMBEDDING_DIR", str(tmp_path))
+    embedder = HashingEmbedder(dim=64)
+    lecture = CompactTranscript([i * 10.0 for i in range(20)], [10.0] * 20, [f"gradient step {i}" for i in range(20)])
+    built = EmbeddingIndex.load_or_build(lecture, "v1", embedder)
+    reloaded = EmbeddingIndex.load_or_build(lecture, "v1", embedder)
+    assert isinstance(reloaded.matrix, np.memmap) and np.array_equal(reloaded.matrix, built.matrix)
+
+    edited = CompactTranscript(lecture.starts, lecture.durations, [f"dropout layer {i}" for i in range(20)])
+    rebuilt = EmbeddingIndex.load_or_build(edited, "v1", embedder)
+    assert not isinstance(rebuilt.matrix, np.memmap) and not np.array_equal(rebuilt.matrix, built.matrix)
+
+    EmbeddingIndex.load_or_build(lecture, "v2", embedder)
+    monkeypatch.setattr("context_extractor.get_default_cache", lambda: TranscriptCache(":memory:"))
+    ContextExtractorRegistry().invalidate("v1", purge_cache=True)
+    assert sorted(path.name.split(".")[0] for path in tmp_path.iterdir()) == ["v2", "v2"]
+
+    EmbeddingIndex.load_or_build(lecture, "v3", embedder, max_bytes=0)
+    assert sorted(path.name.split(".")[0] for path in tmp_path.iterdir()) == ["v3", "v3"]
+
+
+def test_chapter_summaries_do_not_hold_up_video_loads():
+    registry = ContextExtractorRegistry(max_workers=1, summary_workers=1)
+    release = threading.Event()
+    extractor = SimpleNamespace(video_id="v1", chapters=None, summarize_chapters=lambda summarizer: release.wait(5))
+    registry.summarize_chapters(extractor, None)
+    registry.summarize_chapters(extractor, None)
+    assert registry._summarizing == {"v1"}
+    assert registry._executor.submit(lambda: "loaded").result(timeout=1) == "loaded"
+    release.set()
+
+
+def test_agent_compiles_each_graph_once():
+    agent = fake_agent(0.0)
+    compiled = []
+    create_graph = agent.create_graph
+    agent.create_graph = lambda checkpointer=None: compiled.append(checkpointer) or create_graph(checkpointer)
+    graph = agent.get_graph()
+    agent.execute_task("What is a Jacobian?")
+    agent.execute_batch(["What is a Hessian?", "What is a saddle point?"], requests_per_second=1000)
+    assert agent.get_graph() is graph
+    assert agent.get_batch_graph() is agent.get_batch_graph() is not graph
+    assert len(compiled) == 2
+
+
+def test_execute_batch_dedupes_questions_and_keeps_order():
+    class OverlapCountingModel(FakeChatModel):
+        active: int = 0
+        peak: int = 0
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            try:
+                return await super()._agenerate(messages, stop, run_manager, **kwargs)
+            finally:
+                self.active -= 1
+
+    agent = fake_agent(0.05)
+    agent.model.chat = OverlapCountingModel(latency=0.05)
+    queries = ["What is a gradient?", "what is a gradient", "Explain dropout", "What is a gradient?"]
+    results = agent.execute_batch(queries, requests_per_second=1000)
+    assert agent.model.chat.peak == 2
+    assert [r["query"] for r in results] == queries
+    assert all(r["error"] is None and r["answer"] for r in results)
+    assert results[0]["answer"] == results[1]["answer"] == results[3]["answer"] != results[2]["answer"]
+    assert agent.model.chat.calls == 4
+
+
+class ErrorTopicModel(FakeChatModel):
+    """Fails on prompts mentioning a crash and explains error handling otherwise"""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if "crash" in "".join(str(m.content) for m in messages):
+            raise RuntimeError("provider unavailable")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(
+            content="Error handling in Python works by raising and catching exceptions."))])
+
+
+def test_execute_batch_reports_failed_runs_not_answers_about_errors():
+    agent = fake_agent(0.0)
+    agent.model.chat = ErrorTopicModel()
+    results = agent.execute_batch(["How does error handling work?", "Why did it crash?"], requests_per_second=1000)
+    assert results[0]["error"] is None and results[0]["answer"].startswith("Error handling in Python")
+    assert results[1]["answer"] is None and "provider unavailable" in results[1]["error"]
+
+
+def test_transcript_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("transcript_cache.time.time", lambda: clock[0])
+    rng = random.Random(7)
+    payload = lambda: "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(3000))
+
+    cache = TranscriptCache(":memory:", ttl=60, max_bytes=None)
+    cache.set("transcript", "vid", {"snippets": [["hi", 0.0, 1.0]]})
+    assert cache.get("transcript", "vid") == {"snippets": [["hi", 0.0, 1.0]]}
+    assert cache.get("metadata", "vid") is None
+    clock[0] += 61
+    assert cache.get("transcript", "vid") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache = TranscriptCache(":memory:", ttl=None, max_bytes=None)
+    cache.set("transcript", "a", payload())
+    cache.max_bytes = 2 * cache.size_bytes() + 100
+    for video_id in ("b", "a", "c"):
+        clock[0] += 1
+        if video_id == "a":
+            assert cache.get("transcript", "a") is not None
+        else:
+            cache.set("transcript", video_id, payload())
+    assert cache.get("transcript", "b") is None
+    assert cache.get("transcript", "a") is not None and cache.get("transcript", "c") is not None
+
+
+def test_response_cache_matches_near_duplicates_of_the_same_question(monkeypatch):
+    cache = ResponseCache(maxsize=2, ttl=60, threshold=0.8)
+    scope, segments = ("groq", "model", "vid"), [3, 4, 5]
+    cache.set(scope, segments, "Why does Python use indentation?", "why-answer")
+    assert cache.get(scope, segments, "why does python use indentation") == "why-answer"
+    assert cache.get(scope, segments, "Why does Python use the indentation?") == "why-answer"
+    assert cache.get(scope, segments, "Why does Python use indentation for blocks?") == "why-answer"
+    assert cache.get(scope, segments, "How does Python use indentation?") is None
+    assert cache.get(scope, segments, "What is python indentation use") is None
+    assert cache.get(scope, [3, 4], "Why does Python use indentation?") is None
+    assert cache.get(("groq", "model", "other"), segments, "Why does Python use indentation?") is None
+
+    cache.set(scope, segments, "What is a tensor?", "tensor-answer")
+    cache.get(scope, segments, "Why does Python use indentation?")
+    cache.set(scope, segments, "What is dropout?", "dropout-answer")
+    assert cache.get(scope, segments, "What is a tensor?") is None
+    assert cache.get(scope, segments, "Why does Python use indentation?") == "why-answer"
+
+    clock = [time.monotonic() + 61]
+    monkeypatch.setattr("ttl_cache.time.monotonic", lambda: clock[0])
+    assert cache.get(scope, segments, "What is dropout?") is None
+
+
+def test_context_assembler_stays_under_budget_and_skips_overlapping_hits():
+    transcript = CompactTranscript([i * 5.0 for i in range(40)], [5.0] * 40, [f"segment {i} text" for i in range(40)])
+    cost = count_tokens("segment 10 text")
+    overlapping = count_tokens("[0:00:50] segment 10 text segment 11 text")
+    fits = count_tokens("[0:02:30] segment 30 text segment 31 text")
+    over_budget = count_tokens("[0:02:55] segment 35 text segment 36 text")
+    assembler = ContextAssembler(token_budget=cost * 4 + fits + count_tokens(RELATED_HEADER))
+    hits = [
+        {"start": 50.0, "first_segment": 10, "last_segment": 12},
+        {"start": 150.0, "first_segment": 30, "last_segment": 32},
+        {"start": 175.0, "first_segment": 35, "last_segment": 37},
+    ]
+    assembled = assembler.assemble(transcript, range(9, 13), 55.0, hits)
+
+    assert assembled.segments == [9, 10, 11, 12, 30, 31]
+    assert assembled.text.startswith("segment 9 text segment 10 text segment 11 text segment 12 text")
+    assert "Related parts of the lecture:\n[0:02:30] segment 30 text segment 31 text" in assembled.text
+    assert "segment 35" not in assembled.text
+    assert assembled.tokens == assembler.token_budget
+    assert assembled.naive_tokens == 4 * cost + overlapping + fits + over_budget
+    assert assembled.tokens_saved == assembled.naive_tokens - assembled.tokens
+
+
+def test_metadata_service_keeps_partial_results_out_of_the_cache():
+    class Failing:
+        name, complete = "ytdlp_fast", True
+
+        def fetch(self, url):
+            raise OSError("transient")
+
+    class TitleOnly:
+        name, complete = "oembed", False
+
+        def fetch(self, url):
+            return {"title": "Lecture", "author": "Channel", "description": "", "length": "Unknown", "chapters": []}
+
+    cache = TranscriptCache(":memory:")
+    service = MetadataService([Failing(), TitleOnly()], cache=cache)
+    assert service.get("https://youtu.be/vid", "vid")["title"] == "Lecture"
+    assert cache.get("metadata", "vid") is None
+    assert service.get("https://youtu.be/vid", "vid")["title"] == "Lecture"
+    assert service.served_by == {"oembed": 1}
+
+
+def test_rewrite_cache_is_keyed_on_conversation_history():
+    def ask(previous_question, previous_answer):
+        agent = fake_agent(0.0)
+        agent.remember(previous_question, previous_answer)
+        agent.execute_task("Why does it help with that?")
+        return agent.request_metrics[-1]["optimizer"]
+
+    assert ask("What is dropout?", "Dropout zeroes random activations.") == "llm"
+    assert ask("What is momentum?", "Momentum averages past gradients.") == "llm"
+    assert ask("What is dropout?", "Dropout zeroes random activations.") == "cached"
@@ -0,0 +1,82 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from langchain_core.messages import ToolMessage
+
+from telemetry import get_telemetry
+
+DEFAULT_TOOL_TIMEOUT = 15.0
+
+_tool_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="kriar-tools")
+
+
+def tool_error(call, text):
+    return ToolMessage(content=text, name=call["name"], tool_call_id=call["id"], status="error")
+
+
+class ToolRunner:
+    """Runs the tool calls of the last AI message concurrently, each under its own timeout.
+
+    A drop-in for ToolNode in the graph: returns {"messages": [ToolMessage, ...]}
+    in tool-call order. A call that fails or outlives its timeout is answered
+    with an error ToolMessage instead of failing the turn; a timed-out thread
+    is left to finish in the background.
+    """
+
+    def __init__(self, tools, timeout=DEFAULT_TOOL_TIMEOUT, timeouts=None, executor=_tool_executor):
+        self.tools = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.executor = executor
+
+    def timeout_for(self, name):
+        return self.timeouts.get(name, self.timeout)
+
+    @staticmethod
+    def tool_calls(state):
+        messages = state.get("messages", [])
+        return list(getattr(messages[-1], "tool_calls", None) or []) if messages else []
+
+    def run_call(self, call):
+        """Run one tool call in a span, turning exceptions into an error ToolMessage"""
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return tool_error(call, f"Error: unknown tool {call['name']}")
+        with get_telemetry().span(f"tool:{call['name']}"):
+            try:
+                return tool.invoke({**call, "type": "tool_call"})
+            except Exception as e:
+                return tool_error(call, f"Error: {e}")
+
+    async def arun_call(self, call):
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            return tool_error(call, f"Error: unknown tool {call['name']}")
+        timeout = self.timeout_for(call["name"])
+        with get_telemetry().span(f"tool:{call['name']}") as span:
+            try:
+                return await asyncio.wait_for(tool.ainvoke({**call, "type": "tool_call"}), timeout)
+            except asyncio.TimeoutError:
+                span["timed_out"] = True
+                return tool_error(call, f"Error: {call['name']} timed out after {timeout:g}s")
+            except Exception as e:
+                return tool_error(call, f"Error: {e}")
+
+    def invoke(self, state):
+        calls = self.tool_calls(state)
+        started = time.monotonic()
+        # Copy the context per call so tool spans land on the current request's trace
+        futures = [self.executor.submit(contextvars.copy_context().run, self.run_call, call) for call in calls]
+        messages = []
+        for call, future in zip(calls, futures):
+            timeout = self.timeout_for(call["name"])
+            try:
+                messages.append(future.result(timeout=max(0.0, started + timeout - time.monotonic())))
+            except FutureTimeoutError:
+                messages.append(tool_error(call, f"Error: {call['name']} timed out after {timeout:g}s"))
+        return {"messages": messages}
+
+    async def ainvoke(self, state):
+        return {"messages": list(await asyncio.gather(*(self.arun_call(call) for call in self.tool_calls(state))))}
@@ -1,5 +1,5 @@
 from langchain.agents import tool
-from langchain_community.utilities import WikipediaAPIWrapper
+from wikipedia_client import get_wikipedia_client
 
 @tool
 def wikipedia_query(query: str) -> str:
@@ -8,14 +8,9 @@ def wikipedia_query(query: str) -> str:
     Input: a search query string.
     """
     try:
-        wiki_api = WikipediaAPIWrapper(
-            lang="en",
-            top_k_results=2,
-            doc_content_chars_max=500,
-        )
-        return wiki_api.run(query)
+        return get_wikipedia_client().run(query)
     except Exception as e:
         return f"Error querying Wikipedia: {str(e)}"
 
 
-tools = [wikipedia_query]
\ No newline at end of file
+tools = [wikipedia_query]
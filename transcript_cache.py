@@ -0,0 +1,137 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "kriar", "cache.sqlite3")
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class TranscriptCache:
+    """SQLite-backed cache of transcripts and metadata keyed by video ID.
+
+    Entries are stored as zlib-compressed JSON. Reads past ``ttl`` seconds are
+    treated as misses, and once the stored payloads exceed ``max_bytes`` the
+    least recently accessed entries are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (kind, video_id)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get(self, kind, video_id):
+        """Return the cached value for (kind, video_id) or None on a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM entries WHERE kind = ? AND video_id = ?",
+                (kind, video_id),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            payload, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE kind = ? AND video_id = ?", (kind, video_id))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE kind = ? AND video_id = ?",
+                (now, kind, video_id),
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+    def set(self, kind, video_id, value):
+        """Store a JSON-serializable value and evict old entries if over budget"""
+        payload = zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, video_id, payload, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, video_id, payload, len(payload), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, video_id, kind=None):
+        """Remove every entry for a video, or only one kind of entry"""
+        with self._lock:
+            if kind is None:
+                self._conn.execute("DELETE FROM entries WHERE video_id = ?", (video_id,))
+            else:
+                self._conn.execute("DELETE FROM entries WHERE kind = ? AND video_id = ?", (kind, video_id))
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently accessed entries until under max_bytes"""
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT kind, video_id, size FROM entries ORDER BY accessed_at ASC").fetchall()
+        for kind, video_id, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE kind = ? AND video_id = ?", (kind, video_id))
+            total -= size
+
+    def size_bytes(self):
+        """Total size of the stored payloads"""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters for this cache"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Process-wide cache, configured through KRIAR_CACHE_PATH / KRIAR_CACHE_TTL / KRIAR_CACHE_MAX_BYTES"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TranscriptCache(
+                path=os.getenv("KRIAR_CACHE_PATH", DEFAULT_CACHE_PATH),
+                ttl=float(os.getenv("KRIAR_CACHE_TTL", DEFAULT_TTL)),
+                max_bytes=int(os.getenv("KRIAR_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _default_cache
@@ -0,0 +1,170 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+
+def format_timestamp(seconds):
+    """Render seconds as H:MM:SS for prompts and the UI"""
+    return str(timedelta(seconds=int(seconds)))
+
+
+class CompactTranscript:
+    """Columnar, start-ordered transcript storage.
+
+    Start times and durations live in float arrays and all snippet text is kept in
+    one string with an offsets array, so a loaded lecture costs a few arrays rather
+    than one Python object per snippet. The stdlib ``array`` type is used because
+    ``bisect`` searches it directly, with no conversion per lookup.
+    """
+
+    __slots__ = ("starts", "durations", "offsets", "buffer", "language", "language_code", "is_generated")
+
+    def __init__(self, starts, durations, texts, language="", language_code="", is_generated=False):
+        order = sorted(range(len(starts)), key=lambda i: starts[i])
+        self.starts = array("d", (starts[i] for i in order))
+        self.durations = array("d", (durations[i] for i in order))
+        self.offsets = array("q", [0])
+        parts = []
+        position = 0
+        for i in order:
+            parts.append(texts[i])
+            position += len(texts[i])
+            self.offsets.append(position)
+        self.buffer = "".join(parts)
+        self.language = language
+        self.language_code = language_code
+        self.is_generated = is_generated
+
+    @classmethod
+    def from_snippets(cls, snippets, **kwargs):
+        """Build from FetchedTranscriptSnippet-like objects"""
+        return cls(
+            [snippet.start for snippet in snippets],
+            [snippet.duration for snippet in snippets],
+            [snippet.text for snippet in snippets],
+            **kwargs,
+        )
+
+    @classmethod
+    def from_rows(cls, rows, **kwargs):
+        """Build from [text, start, duration] rows as stored in the transcript cache"""
+        return cls([r[1] for r in rows], [r[2] for r in rows], [r[0] for r in rows], **kwargs)
+
+    def to_rows(self):
+        """[text, start, duration] rows for the transcript cache"""
+        return [[self.text(i), self.starts[i], self.durations[i]] for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, i):
+        """Text of segment i"""
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def join(self, indices, sep=""):
+        """Concatenated text of the given segments"""
+        return sep.join(self.buffer[self.offsets[i]:self.offsets[i + 1]] for i in indices)
+
+    def full_text(self):
+        """Whole transcript as space-separated text"""
+        return self.join(range(len(self)), " ")
+
+    def memory_usage(self):
+        """Approximate bytes held by the columns and text buffer"""
+        return sum(
+            sys.getsizeof(column)
+            for column in (self.starts, self.durations, self.offsets, self.buffer)
+        )
+
+
+class TranscriptIndex:
+    """Center-sorted view over a CompactTranscript for timestamp lookups.
+
+    Segments are numbered by their position in start order. ``select`` returns the
+    same segments ``ContextExtractor.extract_context`` has always picked, in
+    O(log n + k log k) instead of sorting the whole transcript on every call.
+    """
+
+    def __init__(self, transcript):
+        self.transcript = transcript
+        starts, durations = transcript.starts, transcript.durations
+        centers = [s + (d / 2) for s, d in zip(starts, durations)]
+        self.center_order = array("q", sorted(range(len(centers)), key=lambda i: centers[i]))
+        self.centers = array("d", (centers[i] for i in self.center_order))
+
+    @classmethod
+    def from_snippets(cls, snippets):
+        """Build an index from FetchedTranscriptSnippet-like objects"""
+        return cls(CompactTranscript.from_snippets(snippets))
+
+    def __len__(self):
+        return len(self.transcript)
+
+    def window(self, target, context_window):
+        """Indices of segments whose center lies within context_window of target"""
+        centers = self.centers
+        lo = bisect_left(centers, target - context_window)
+        hi = bisect_right(centers, target + context_window)
+        # Widen by the rounding slack between ``c >= t - w`` and ``abs(c - t) <= w``
+        while lo > 0 and abs(centers[lo - 1] - target) <= context_window:
+            lo -= 1
+        while hi < len(centers) and abs(centers[hi] - target) <= context_window:
+            hi += 1
+        return [
+            self.center_order[i] for i in range(lo, hi)
+            if abs(centers[i] - target) <= context_window
+        ]
+
+    def nearest(self, target, count):
+        """Indices of the count segments whose start is closest to target"""
+        starts = self.transcript.starts
+        n = len(starts)
+        if count <= 0 or n == 0:
+            return []
+        right = bisect_left(starts, target)
+        left = right - 1
+        picked = []
+        while len(picked) < count and (left >= 0 or right < n):
+            if right >= n or (left >= 0 and target - starts[left] <= starts[right] - target):
+                picked.append(left)
+                left -= 1
+            else:
+                picked.append(right)
+                right += 1
+        # Pull in ties at the cut-off so ordering by (distance, position) stays exact
+        cutoff = max(abs(starts[i] - target) for i in picked)
+        while left >= 0 and abs(starts[left] - target) <= cutoff:
+            picked.append(left)
+            left -= 1
+        while right < n and abs(starts[right] - target) <= cutoff:
+            picked.append(right)
+            right += 1
+        return picked
+
+    def select(self, target, num_segments, context_window):
+        """Indices (in start order) of the segments to use as context around target"""
+        if not len(self):
+            return []
+        candidates = self.window(target, context_window)
+        if not candidates:
+            candidates = self.nearest(target, num_segments)
+        starts = self.transcript.starts
+        candidates.sort(key=lambda i: (abs(starts[i] - target), i))
+        return sorted(candidates[:num_segments])
+
+    def segment(self, i, target):
+        """Segment i as the dict shape returned by extract_context"""
+        start = self.transcript.starts[i]
+        duration = self.transcript.durations[i]
+        return {
+            'text': self.transcript.text(i),
+            'start': start,
+            'duration': duration,
+            'end': start + duration,
+            'distance_from_target': abs(start - target),
+        }
+
+    def memory_usage(self):
+        """Approximate bytes held by the index on top of its transcript"""
+        return sys.getsizeof(self.center_order) + sys.getsizeof(self.centers)
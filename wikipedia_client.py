@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bm25_index import tokenize
+from response_cache import normalize_query
+from telemetry import get_telemetry
+from ttl_cache import TTLCache
+
+WIKIPEDIA_MAX_QUERY_LENGTH = 300
+NO_RESULT = "No good Wikipedia Search Result was found"
+
+
+def format_summaries(pages, doc_content_chars_max):
+    """Pages as WikipediaAPIWrapper formats them: title and summary blocks, truncated"""
+    summaries = [f"Page: {title}\nSummary: {summary}" for title, summary in pages if summary]
+    if not summaries:
+        return NO_RESULT
+    return "\n\n".join(summaries)[:doc_content_chars_max]
+
+
+class OfflineWikipedia:
+    """Article summaries preloaded into a local SQLite FTS5 table, searched with bm25 ranking"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS articles USING fts5(title, summary)")
+        self._conn.commit()
+
+    @classmethod
+    def build(cls, path, articles):
+        """Create (or extend) an offline index from (title, summary) pairs, e.g. from a dump"""
+        index = cls(path)
+        with index._lock:
+            index._conn.executemany("INSERT INTO articles (title, summary) VALUES (?, ?)", articles)
+            index._conn.commit()
+        return index
+
+    def search(self, query, top_k=2):
+        """(title, summary) of the best matching articles; an exact title match comes first.
+
+        Ranked matches must contain every content word of the query, so an
+        article sharing a single word is not served in place of an API lookup.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = " AND ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        with self._lock:
+            exact = self._conn.execute(
+                "SELECT title, summary FROM articles WHERE title = ? COLLATE NOCASE LIMIT 1", (query.strip(),)
+            ).fetchall()
+            ranked = self._conn.execute(
+                "SELECT title, summary FROM articles WHERE articles MATCH ? ORDER BY bm25(articles, 10.0, 1.0) LIMIT ?",
+                (match, top_k),
+            ).fetchall()
+        pages = exact + [row for row in ranked if row not in exact]
+        return pages[:top_k]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+
+class WikipediaClient:
+    """Shared Wikipedia lookup: offline index first, then the MediaWiki API over a pooled session.
+
+    Search and intro extracts take two API requests per lookup (the wikipedia
+    package makes one request per page on top of the search). Results are
+    cached by normalized query.
+    """
+
+    def __init__(self, lang="en", top_k_results=2, doc_content_chars_max=500, cache=None, offline=None,
+                 session=None, timeout=10.0):
+        self.api_url = f"https://{lang}.wikipedia.org/w/api.php"
+        self.top_k_results = top_k_results
+        self.doc_content_chars_max = doc_content_chars_max
+        self.cache = cache if cache is not None else TTLCache(maxsize=4096, ttl=24 * 3600.0)
+        self.offline = offline
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.headers["User-Agent"] = "KriarLearningAssistant/1.0 (educational assistant)"
+        self.session = session
+        self.offline_hits = 0
+        self.api_calls = 0
+
+    def _api(self, **params):
+        self.api_calls += 1
+        response = self.session.get(
+            self.api_url, params={"format": "json", "formatversion": 2, **params}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch(self, query):
+        """(title, summary) pairs for query from the MediaWiki API"""
+        search = self._api(action="query", list="search", srsearch=query, srlimit=self.top_k_results, srprop="")
+        titles = [hit["title"] for hit in search.get("query", {}).get("search", [])]
+        if not titles:
+            return []
+        pages = self._api(
+            action="query", prop="extracts", exintro=1, explaintext=1, redirects=1, titles="|".join(titles)
+        ).get("query", {}).get("pages", [])
+        extracts = {page.get("title"): page.get("extract", "") for page in pages}
+        return [(title, extracts[title].strip()) for title in titles if extracts.get(title)]
+
+    def run(self, query):
+        """Summaries for query, formatted like WikipediaAPIWrapper.run"""
+        query = query[:WIKIPEDIA_MAX_QUERY_LENGTH]
+        key = normalize_query(query)
+        with get_telemetry().span("wikipedia") as span:
+            cached = self.cache.get(key)
+            span["cache_hit"] = cached is not None
+            if cached is not None:
+                return cached
+            pages = self.offline.search(query, self.top_k_results) if self.offline is not None else []
+            span["source"] = "offline" if pages else "api"
+            if pages:
+                self.offline_hits += 1
+            else:
+                pages = self.fetch(query)
+            result = format_summaries(pages, self.doc_content_chars_max)
+            if pages:
+                self.cache.set(key, result)
+            return result
+
+    def stats(self):
+        return {**self.cache.stats(), "offline_hits": self.offline_hits, "api_calls": self.api_calls}
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_wikipedia_client():
+    """Process-wide client; KRIAR_WIKIPEDIA_DB points it at an offline FTS5 index"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            path = os.getenv("KRIAR_WIKIPEDIA_DB")
+            offline = OfflineWikipedia(path) if path and os.path.exists(path) else None
+            _default_client = WikipediaClient(offline=offline)
+        return _default_client